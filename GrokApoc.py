@@ -1,180 +1,188 @@
-import pygame
 import math
-import random
 import json
 import os
 import sys
+import time
+from collections import OrderedDict
+
+IMPORT_STARTED = time.perf_counter()  # Start of the import-to-first-frame startup timing
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pygame
+
+from apoca.config import DEFAULT_SETTINGS, INFECTED_ATTACK_RADIUS, SETTING_LIMITS, load_settings, save_settings
+from apoca.horde import HORDE_TARGET_AGENTS
+from apoca.perf import HISTOGRAM_BIN_MS, HISTOGRAM_BINS, PHASES, FrameStats
+from apoca.recording import InputRecorder
+from apoca.simulation import TICK_RATE, new_match, step
+from apoca.world import create_world
 
-# Initialize Pygame
-pygame.init()
+# Importing this module has no side effects: the window, fonts, saved files
+# and the map are only set up by init() and get_world().
 
 # Constants
-SCREEN_WIDTH, SCREEN_HEIGHT = pygame.display.Info().current_w, pygame.display.Info().current_h
 WHITE, BLACK, GRAY, DARK_GRAY = (255, 255, 255), (0, 0, 0), (50, 50, 50), (20, 20, 20)
 RED, PURPLE = (200, 0, 0), (100, 0, 200)
 BUTTON_COLOR, HOVER_COLOR, TEXT_COLOR = (100, 100, 100), (150, 150, 150), (255, 255, 255)
 INFECTED_COLOR, BULLET_COLOR = (0, 255, 0), (255, 0, 0)
 SURVIVOR_COLORS = [(0, 0, 255), (128, 0, 128), (255, 0, 0), (255, 255, 0), (0, 255, 255)]
 GROUND_COLOR = (80, 40, 20)
-BORDER_WIDTH = 50
-PLAYABLE_LEFT, PLAYABLE_RIGHT = BORDER_WIDTH, SCREEN_WIDTH - BORDER_WIDTH
-PLAYABLE_TOP, PLAYABLE_BOTTOM = BORDER_WIDTH, SCREEN_HEIGHT - BORDER_WIDTH
-INFECTED_ATTACK_RADIUS = 50
-
-# Default Game Settings
-DEFAULT_SETTINGS = {
-    "player_size": 20,
-    "survivor_speed": 5,
-    "infected_speed": 7,
-    "bullet_speed": 10,
-    "action_cooldown": 1.0,
-    "ai_difficulty": 1,  # 1=Easy, 2=Medium, 3=Hard
-}
-
-# Load settings
+
+# Screen size, known once the display is open
+SCREEN_WIDTH = SCREEN_HEIGHT = 0
+
+# Game Settings, checked and compiled into a MatchConfig at the start of each match
 SETTINGS_FILE = "game_settings.json"
 game_settings = DEFAULT_SETTINGS.copy()
-if os.path.exists(SETTINGS_FILE):
-    try:
-        with open(SETTINGS_FILE, "r") as f:
-            loaded_settings = json.load(f)
-            game_settings.update(loaded_settings)
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"Warning: Failed to load {SETTINGS_FILE} ({e}). Using defaults.")
-
-# Screen setup
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
-pygame.display.set_caption("Apoca")
-
-# Fonts and Resources
-font, small_font, name_font = pygame.font.Font(None, 50), pygame.font.Font(None, 36), pygame.font.Font(None, 30)
-radius_surface = pygame.Surface((INFECTED_ATTACK_RADIUS * 2, INFECTED_ATTACK_RADIUS * 2), pygame.SRCALPHA)
-pygame.draw.circle(radius_surface, (255, 165, 0, 100), (INFECTED_ATTACK_RADIUS, INFECTED_ATTACK_RADIUS), INFECTED_ATTACK_RADIUS)
-
-# Spawn Points
-spawn_points = [
-    [PLAYABLE_LEFT + 50, PLAYABLE_TOP + 50], [PLAYABLE_RIGHT - 50, PLAYABLE_TOP + 50],
-    [PLAYABLE_LEFT + 50, PLAYABLE_BOTTOM - 50], [PLAYABLE_RIGHT - 50, PLAYABLE_BOTTOM - 50],
-    [SCREEN_WIDTH // 2, PLAYABLE_TOP + 50], [SCREEN_WIDTH // 2, PLAYABLE_BOTTOM - 50],
-    [PLAYABLE_LEFT + 50, SCREEN_HEIGHT // 2], [PLAYABLE_RIGHT - 50, SCREEN_HEIGHT // 2],
-]
 
-# Building Generation
-def is_point_in_safe_zone(x, y, spawn_points, safe_radius=100):
-    for sp in spawn_points:
-        if math.sqrt((x - sp[0])**2 + (y - sp[1])**2) < safe_radius:
-            return True
-    return False
-
-def flood_fill(grid, start_x, start_y, width, height):
-    visited = set()
-    stack = [(start_x, start_y)]
-    while stack:
-        x, y = stack.pop()
-        if (x, y) in visited or x < 0 or x >= width or y < 0 or y >= height or grid[y][x]:
-            continue
-        visited.add((x, y))
-        stack.extend([(x+1, y), (x-1, y), (x, y+1), (x, y-1)])
-    return visited
-
-def generate_buildings():
-    buildings = []
-    safe_radius = 100
-    for _ in range(8):
-        while True:
-            x = random.randint(PLAYABLE_LEFT + 50, PLAYABLE_RIGHT - 50)
-            y = random.randint(PLAYABLE_TOP + 50, PLAYABLE_BOTTOM - 50)
-            width = random.randint(100, 300)
-            height = random.randint(100, 300)
-            new_wall = pygame.Rect(x, y, width, height)
-            if not is_point_in_safe_zone(x, y, spawn_points, safe_radius):
-                buildings.append(new_wall)
-                break
-    for _ in range(15):
-        while True:
-            x = random.randint(PLAYABLE_LEFT + 50, PLAYABLE_RIGHT - 50)
-            y = random.randint(PLAYABLE_TOP + 50, PLAYABLE_BOTTOM - 50)
-            width = random.randint(50, 150)
-            height = random.randint(50, 150)
-            new_wall = pygame.Rect(x, y, width, height)
-            if not is_point_in_safe_zone(x, y, spawn_points, safe_radius) and sum(new_wall.colliderect(b) for b in buildings) < 2:
-                buildings.append(new_wall)
-                break
-    grid_width = (PLAYABLE_RIGHT - PLAYABLE_LEFT) // 10
-    grid_height = (PLAYABLE_BOTTOM - PLAYABLE_TOP) // 10
-    grid = [[0 for _ in range(grid_width)] for _ in range(grid_height)]
-    for building in buildings:
-        grid_x_start = max(0, (building.x - PLAYABLE_LEFT) // 10)
-        grid_x_end = min(grid_width, (building.x + building.width - PLAYABLE_LEFT) // 10)
-        grid_y_start = max(0, (building.y - PLAYABLE_TOP) // 10)
-        grid_y_end = min(grid_height, (building.y + building.height - PLAYABLE_TOP) // 10)
-        for y in range(grid_y_start, grid_y_end):
-            for x in range(grid_x_start, grid_x_end):
-                grid[y][x] = 1
-    center_x, center_y = grid_width // 2, grid_height // 2
-    reachable = flood_fill(grid, center_x, center_y, grid_width, grid_height)
-    for sp in spawn_points:
-        grid_x = (sp[0] - PLAYABLE_LEFT) // 10
-        grid_y = (sp[1] - PLAYABLE_TOP) // 10
-        if (grid_x, grid_y) not in reachable:
-            for i, building in enumerate(buildings[:]):
-                if pygame.Rect(sp[0] - 50, sp[1] - 50, 100, 100).colliderect(building):
-                    buildings.pop(i)
-                    grid = [[0 for _ in range(grid_width)] for _ in range(grid_height)]
-                    for b in buildings:
-                        gx_start = max(0, (b.x - PLAYABLE_LEFT) // 10)
-                        gx_end = min(grid_width, (b.x + b.width - PLAYABLE_LEFT) // 10)
-                        gy_start = max(0, (b.y - PLAYABLE_TOP) // 10)
-                        gy_end = min(grid_height, (b.y + b.height - PLAYABLE_TOP) // 10)
-                        for y in range(gy_start, gy_end):
-                            for x in range(gx_start, gx_end):
-                                grid[y][x] = 1
-                    reachable = flood_fill(grid, center_x, center_y, grid_width, grid_height)
-                    break
-    return buildings
-
-buildings = generate_buildings()
+def store_settings(settings):
+    game_settings.clear()
+    game_settings.update(settings)
+    try:
+        save_settings(game_settings, SETTINGS_FILE)
+        print("Settings saved successfully.")
+    except IOError as e:
+        print(f"Error saving settings: {e}")
+
+# Simulation and frame timing
+SIM_TICK_RATE = TICK_RATE
+FRAME_RATE = 120
+MAX_FRAME_TIME = 0.25  # Longest frame the simulation catches up on, in seconds
+
+# Matches are recorded so they can be replayed offline with `python -m apoca.recording <file>`
+RECORD_MATCHES = True
+RECORDINGS_DIR = "recordings"
+
+# Performance overlay, toggled in a match with PERF_OVERLAY_KEY; PERF_EXPORT_KEY writes its stats to PERF_DIR
+PERF_OVERLAY_KEY = pygame.K_F3
+PERF_EXPORT_KEY = pygame.K_F4
+PERF_DIR = "perf"
+PERF_REFRESH = 0.25  # Seconds between overlay text updates
 
 # Controls and Skins
 CONTROLS_FILE = "controls.json"
-if os.path.exists(CONTROLS_FILE):
-    with open(CONTROLS_FILE, "r") as f:
-        control_schemes = json.load(f)
-else:
-    control_schemes = [
-        {"left": pygame.K_LEFT, "right": pygame.K_RIGHT, "up": pygame.K_UP, "down": pygame.K_DOWN, "action": pygame.K_SPACE, "name": "P1"},
-        {"left": pygame.K_j, "right": pygame.K_l, "up": pygame.K_i, "down": pygame.K_k, "action": pygame.K_m, "name": "P2"},
-        {"left": pygame.K_t, "right": pygame.K_y, "up": pygame.K_g, "down": pygame.K_h, "action": pygame.K_b, "name": "P3"},
-        {"left": pygame.K_KP4, "right": pygame.K_KP6, "up": pygame.K_KP8, "down": pygame.K_KP2, "action": pygame.K_KP0, "name": "P4"},
-        {"left": pygame.K_a, "right": pygame.K_d, "up": pygame.K_w, "down": pygame.K_s, "action": pygame.K_e, "name": "P5"},
-    ]
+DEFAULT_CONTROLS = [
+    {"left": pygame.K_LEFT, "right": pygame.K_RIGHT, "up": pygame.K_UP, "down": pygame.K_DOWN, "action": pygame.K_SPACE, "name": "P1"},
+    {"left": pygame.K_j, "right": pygame.K_l, "up": pygame.K_i, "down": pygame.K_k, "action": pygame.K_m, "name": "P2"},
+    {"left": pygame.K_t, "right": pygame.K_y, "up": pygame.K_g, "down": pygame.K_h, "action": pygame.K_b, "name": "P3"},
+    {"left": pygame.K_KP4, "right": pygame.K_KP6, "up": pygame.K_KP8, "down": pygame.K_KP2, "action": pygame.K_KP0, "name": "P4"},
+    {"left": pygame.K_a, "right": pygame.K_d, "up": pygame.K_w, "down": pygame.K_s, "action": pygame.K_e, "name": "P5"},
+]
+control_schemes = [scheme.copy() for scheme in DEFAULT_CONTROLS]
 
 SKINS_FILE = "skins.json"
 player_skins = SURVIVOR_COLORS[:len(control_schemes)]
-if os.path.exists(SKINS_FILE):
-    with open(SKINS_FILE, "r") as f:
-        player_skins = json.load(f)
+
+def load_controls_and_skins():
+    global control_schemes, player_skins
+    if os.path.exists(CONTROLS_FILE):
+        with open(CONTROLS_FILE, "r") as f:
+            control_schemes = json.load(f)
+    player_skins = SURVIVOR_COLORS[:len(control_schemes)]
+    if os.path.exists(SKINS_FILE):
+        with open(SKINS_FILE, "r") as f:
+            player_skins = json.load(f)
+
+# Display, fonts and resources, created by init_display()
+screen = None
+font = small_font = name_font = None
+radius_surface = None
+
+def init_display():
+    global SCREEN_WIDTH, SCREEN_HEIGHT
+    global screen, font, small_font, name_font, radius_surface
+    if screen is not None:
+        return
+    pygame.init()
+    SCREEN_WIDTH, SCREEN_HEIGHT = pygame.display.Info().current_w, pygame.display.Info().current_h
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
+    pygame.display.set_caption("Apoca")
+    font, small_font, name_font = pygame.font.Font(None, 50), pygame.font.Font(None, 36), pygame.font.Font(None, 30)
+    radius_surface = pygame.Surface((INFECTED_ATTACK_RADIUS * 2, INFECTED_ATTACK_RADIUS * 2), pygame.SRCALPHA)
+    pygame.draw.circle(radius_surface, (255, 165, 0, 100), (INFECTED_ATTACK_RADIUS, INFECTED_ATTACK_RADIUS), INFECTED_ATTACK_RADIUS)
+
+def init():
+    """Load saved settings, controls and skins, and open the window."""
+    game_settings.update(load_settings(SETTINGS_FILE))
+    load_controls_and_skins()
+    init_display()
+
+# Worlds, each generated at the start of the first match of its size and kept for the session
+worlds = {}
+
+def get_world(scale=1):
+    """Map of scale times the screen size in each direction."""
+    if scale not in worlds:
+        worlds[scale] = create_world(SCREEN_WIDTH * scale, SCREEN_HEIGHT * scale)
+    return worlds[scale]
+
+startup_reported = False
+
+def report_startup():
+    global startup_reported
+    if not startup_reported:
+        startup_reported = True
+        print(f"Startup: {(time.perf_counter() - IMPORT_STARTED) * 1000:.0f} ms from import to first frame")
 
 # UI Functions
+class TextCache:
+    """Bounded LRU cache of rendered text surfaces, keyed by font, text and colour."""
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = self.surfaces[key] = font.render(text, True, color)
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.surfaces)}
+
+text_cache = TextCache()
+
+def render_text(font, text, color):
+    return text_cache.render(font, text, color)
+
+gradient_cache = {}
+
+def build_gradient(color1, color2, size):
+    width, height = size
+    y = np.arange(height)[:, None]
+    rows = (np.array(color1) + (np.array(color2) - np.array(color1)) * y / height).astype(np.uint8)
+    gradient = pygame.surfarray.make_surface(np.broadcast_to(rows, (width, height, 3)))
+    return gradient.convert() if pygame.display.get_surface() else gradient
+
 def draw_gradient_background(surface, color1, color2):
-    for y in range(SCREEN_HEIGHT):
-        r = int(color1[0] + (color2[0] - color1[0]) * y / SCREEN_HEIGHT)
-        g = int(color1[1] + (color2[1] - color1[1]) * y / SCREEN_HEIGHT)
-        b = int(color1[2] + (color2[2] - color1[2]) * y / SCREEN_HEIGHT)
-        pygame.draw.line(surface, (r, g, b), (0, y), (SCREEN_WIDTH, y))
+    key = (tuple(color1), tuple(color2), surface.get_size())
+    gradient = gradient_cache.get(key)
+    if gradient is None:
+        gradient = gradient_cache[key] = build_gradient(color1, color2, surface.get_size())
+    surface.blit(gradient, (0, 0))
 
 def draw_button(surface, text, x, y, width, height, selected=False, hovered=False, border_color=WHITE):
     color = HOVER_COLOR if hovered else (BUTTON_COLOR if not selected else DARK_GRAY)
     pygame.draw.rect(surface, color, (x, y, width, height))
     pygame.draw.rect(surface, border_color, (x, y, width, height), 2)
-    label = small_font.render(text, True, TEXT_COLOR)
+    label = render_text(small_font, text, TEXT_COLOR)
     surface.blit(label, label.get_rect(center=(x + width // 2, y + height // 2)))
 
 def draw_title(surface, text, x, y):
-    glow = font.render(text, True, (255, 100, 100))
+    glow = render_text(font, text, (255, 100, 100))
     surface.blit(glow, (x - 2, y - 2))
     surface.blit(glow, (x + 2, y + 2))
-    title = font.render(text, True, WHITE)
+    title = render_text(font, text, WHITE)
     surface.blit(title, (x, y))
 
 def show_controls():
@@ -192,7 +200,7 @@ def show_controls():
             for key in ["left", "right", "up", "down", "action"]:
                 if y >= 50 and y <= SCREEN_HEIGHT - 40:
                     text = f"{scheme['name']} {key.capitalize()}: {pygame.key.name(scheme[key]).upper()}"
-                    label = small_font.render(text, True, WHITE)
+                    label = render_text(small_font, text, WHITE)
                     rect = label.get_rect(topleft=(SCREEN_WIDTH // 4, y))
                     rects.append((rect, i, key))
                     screen.blit(label, rect)
@@ -249,16 +257,16 @@ def game_parameters_menu():
         for key in settings.keys():  # Iterate over keys to avoid duplicates
             if 100 <= y <= SCREEN_HEIGHT - 100:  # Only render if in visible area
                 text = f"{key.replace('_', ' ').title()}: {settings[key]}{' (Easy/Med/Hard)' if key == 'ai_difficulty' else ''}"
-                label = small_font.render(text, True, WHITE)
+                label = render_text(small_font, text, WHITE)
                 screen.blit(label, (SCREEN_WIDTH // 2 - 250, y))
                 minus_rect = pygame.Rect(SCREEN_WIDTH // 2 + 150, y, 30, 30)
                 plus_rect = pygame.Rect(SCREEN_WIDTH // 2 + 190, y, 30, 30)
                 pygame.draw.rect(screen, BUTTON_COLOR, minus_rect)
                 pygame.draw.rect(screen, BUTTON_COLOR, plus_rect)
-                screen.blit(small_font.render("-", True, WHITE), minus_rect.move(10, 5))
-                screen.blit(small_font.render("+", True, WHITE), plus_rect.move(10, 5))
-                rects.append((minus_rect, key, -1 if key == "ai_difficulty" else -0.5 if key == "action_cooldown" else -5 if key == "player_size" else -1))
-                rects.append((plus_rect, key, 1 if key == "ai_difficulty" else 0.5 if key == "action_cooldown" else 5 if key == "player_size" else 1))
+                screen.blit(render_text(small_font, "-", WHITE), minus_rect.move(10, 5))
+                screen.blit(render_text(small_font, "+", WHITE), plus_rect.move(10, 5))
+                rects.append((minus_rect, key, -SETTING_LIMITS[key][2]))
+                rects.append((plus_rect, key, SETTING_LIMITS[key][2]))
             y += option_height
 
         # Draw scrollbar if content exceeds visible area
@@ -277,32 +285,17 @@ def game_parameters_menu():
         for event in pygame.event.get():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                 # Save settings on exit
-                game_settings.clear()
-                game_settings.update(settings)
-                try:
-                    with open(SETTINGS_FILE, "w") as f:
-                        json.dump(game_settings, f)
-                    print("Settings saved successfully.")
-                except IOError as e:
-                    print(f"Error saving settings: {e}")
+                store_settings(settings)
                 return
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left click
                     for rect, key, delta in rects:
                         if rect.collidepoint(event.pos):
-                            min_val = 1 if key in ["survivor_speed", "infected_speed", "bullet_speed", "ai_difficulty"] else 0 if key == "action_cooldown" else 10
-                            max_val = 3 if key == "ai_difficulty" else 2 if key == "action_cooldown" else 200 if key == "player_size" else 20
+                            min_val, max_val, _ = SETTING_LIMITS[key]
                             settings[key] = max(min_val, min(max_val, settings[key] + delta))
                     if SCREEN_WIDTH // 2 - 150 <= event.pos[0] <= SCREEN_WIDTH // 2 + 150 and SCREEN_HEIGHT - 100 <= event.pos[1] <= SCREEN_HEIGHT - 40:
                         # Save settings when pressing "Back"
-                        game_settings.clear()
-                        game_settings.update(settings)
-                        try:
-                            with open(SETTINGS_FILE, "w") as f:
-                                json.dump(game_settings, f)
-                            print("Settings saved successfully.")
-                        except IOError as e:
-                            print(f"Error saving settings: {e}")
+                        store_settings(settings)
                         return
                 elif event.button == 4:  # Scroll up
                     scroll_offset = max(0, scroll_offset - 20)
@@ -313,7 +306,7 @@ def settings_menu():
     while True:
         draw_gradient_background(screen, RED, PURPLE)
         title_text = "Settings"
-        title = font.render(title_text, True, WHITE)
+        title = render_text(font, title_text, WHITE)
         draw_title(screen, title_text, SCREEN_WIDTH // 2 - title.get_width() // 2, 50)
         mouse_pos = pygame.mouse.get_pos()
         buttons = [
@@ -355,9 +348,9 @@ def skin_customization_menu():
             plus_rect = pygame.Rect(SCREEN_WIDTH // 2 + 120, 260 + i * 60, 30, 30)
             pygame.draw.rect(screen, BUTTON_COLOR, minus_rect)
             pygame.draw.rect(screen, BUTTON_COLOR, plus_rect)
-            screen.blit(small_font.render("-", True, WHITE), minus_rect.move(10, 5))
-            screen.blit(small_font.render("+", True, WHITE), plus_rect.move(10, 5))
-            screen.blit(small_font.render(label, True, WHITE), (SCREEN_WIDTH // 2 + 160, 260 + i * 60))
+            screen.blit(render_text(small_font, "-", WHITE), minus_rect.move(10, 5))
+            screen.blit(render_text(small_font, "+", WHITE), plus_rect.move(10, 5))
+            screen.blit(render_text(small_font, label, WHITE), (SCREEN_WIDTH // 2 + 160, 260 + i * 60))
             if minus_rect.collidepoint(mouse_pos) and pygame.mouse.get_pressed()[0]:
                 skins[selected] = (max(0, r - delta[0]), max(0, g - delta[1]), max(0, b - delta[2]))
             if plus_rect.collidepoint(mouse_pos) and pygame.mouse.get_pressed()[0]:
@@ -407,7 +400,7 @@ def main_menu():
     while True:
         draw_gradient_background(screen, RED, PURPLE)
         title_text = "Apoca"
-        title = font.render(title_text, True, WHITE)
+        title = render_text(font, title_text, WHITE)
         draw_title(screen, title_text, SCREEN_WIDTH // 2 - title.get_width() // 2, 100)
         mouse_pos = pygame.mouse.get_pos()
         buttons = [
@@ -418,6 +411,7 @@ def main_menu():
         for i, (text, y, action) in enumerate(buttons):
             draw_button(screen, text, SCREEN_WIDTH // 2 - 150, y, 300, 60, hovered=(SCREEN_WIDTH // 2 - 150 <= mouse_pos[0] <= SCREEN_WIDTH // 2 + 150 and y <= mouse_pos[1] <= y + 60), border_color=SURVIVOR_COLORS[i % len(SURVIVOR_COLORS)])
         pygame.display.flip()
+        report_startup()
         for event in pygame.event.get():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                 pygame.quit()
@@ -449,8 +443,16 @@ def player_menu():
                     if SCREEN_WIDTH // 2 - 150 <= x <= SCREEN_WIDTH // 2 + 150 and btn_y <= y <= btn_y + 60:
                         action()
 
+AI_COUNT_OPTIONS = [0, 1, 2, 5, 10, 20, 50]
+WORLD_SCALE_OPTIONS = [1, 2, 4]
+HORDE_SIZE_OPTIONS = [0, 100, 200, HORDE_TARGET_AGENTS, 500]
+
+def next_ai_count(count):
+    return AI_COUNT_OPTIONS[(AI_COUNT_OPTIONS.index(count) + 1) % len(AI_COUNT_OPTIONS)]
+
 def player_selection_menu():
-    selected_players, selected_timer, selected_ammo, include_ai = 2, 5, -1, False
+    selected_players, selected_timer, selected_ammo = 2, 5, -1
+    ai_survivors, ai_infected, world_scale, horde_size = 0, 0, 1, 0
     while True:
         draw_gradient_background(screen, RED, PURPLE)
         draw_title(screen, "Game Setup", SCREEN_WIDTH // 2 - 100, 50)
@@ -469,7 +471,10 @@ def player_selection_menu():
             ("20 Ammo", SCREEN_WIDTH * 5 // 6 - 250, 220, selected_ammo == 20),
             ("50 Ammo", SCREEN_WIDTH * 5 // 6 - 250, 290, selected_ammo == 50),
             ("Unlimited", SCREEN_WIDTH * 5 // 6 - 250, 360, selected_ammo == -1),
-            (f"AI: {'On' if include_ai else 'Off'}", SCREEN_WIDTH // 2 - 125, 500, include_ai),
+            (f"AI Survivors: {ai_survivors}", SCREEN_WIDTH // 6, 430, ai_survivors > 0),
+            (f"AI Infected: {ai_infected}", SCREEN_WIDTH * 5 // 6 - 250, 430, ai_infected > 0),
+            (f"Map Size: {world_scale}x", SCREEN_WIDTH // 2 - 125, 500, world_scale > 1),
+            (f"Horde: {horde_size or 'Off'}", SCREEN_WIDTH * 5 // 6 - 250, 500, horde_size > 0),
             ("Start Game", SCREEN_WIDTH // 2 - 150, 600, False),
         ]
         for text, x, y, selected in buttons:
@@ -491,215 +496,177 @@ def player_selection_menu():
                             selected_ammo = int(btn_text.split()[0])
                         elif btn_text == "Unlimited":
                             selected_ammo = -1
-                        elif "AI" in btn_text:
-                            include_ai = not include_ai
+                        elif "AI Survivors" in btn_text:
+                            ai_survivors = next_ai_count(ai_survivors)
+                        elif "AI Infected" in btn_text:
+                            ai_infected = next_ai_count(ai_infected)
+                        elif "Map Size" in btn_text:
+                            world_scale = WORLD_SCALE_OPTIONS[(WORLD_SCALE_OPTIONS.index(world_scale) + 1) % len(WORLD_SCALE_OPTIONS)]
+                        elif "Horde" in btn_text:
+                            horde_size = HORDE_SIZE_OPTIONS[(HORDE_SIZE_OPTIONS.index(horde_size) + 1) % len(HORDE_SIZE_OPTIONS)]
                         elif "Start" in btn_text:
-                            game_world(selected_players, selected_timer, selected_ammo, include_ai)
+                            if horde_size:  # The horde takes the place of the AI infected
+                                game_world(selected_players, selected_timer, selected_ammo, ai_survivors, horde_size, world_scale=world_scale, horde=True)
+                            else:
+                                game_world(selected_players, selected_timer, selected_ammo, ai_survivors, ai_infected, world_scale=world_scale)
                             return
 
-def game_world(num_players, timer_duration, max_ammo, include_ai):
-    clock = pygame.time.Clock()
-    start_time = pygame.time.get_ticks()
-    players, bullets = [], []
-    action_cooldown_frames = int(game_settings["action_cooldown"] * 60)
-    pulse_timer = 0
-
-    # Player Setup
-    human_count = num_players - (1 if include_ai else 0)
-    infected_idx = random.randint(0, num_players - 1)
-    for i in range(human_count):
-        pos = spawn_points[i % len(spawn_points)].copy()
-        while any(pygame.Rect(pos[0] - game_settings["player_size"], pos[1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2).colliderect(b) for b in buildings):
-            pos = spawn_points[(i + 1) % len(spawn_points)].copy()
-        char = {
-            "type": "infected" if i == infected_idx else "survivor",
-            "pos": pos, "last_dx": 1, "last_dy": 0, "respawn_timer": 0,
-            "attack_cooldown": 0, "shoot_cooldown": 0, "name": control_schemes[i]["name"],
-            "index": i, "ammo": max_ammo if max_ammo != -1 else float("inf"), "is_ai": False,
-        }
-        players.append({"control": control_schemes[i], "character": char})
-
-    if include_ai:
-        ai_pos = spawn_points[min(human_count, len(spawn_points) - 1)].copy()
-        while any(pygame.Rect(ai_pos[0] - game_settings["player_size"], ai_pos[1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2).colliderect(b) for b in buildings):
-            ai_pos = spawn_points[(human_count + 1) % len(spawn_points)].copy()
-        ai_type = "infected" if not any(p["character"]["type"] == "infected" for p in players) else "survivor"
-        players.append({
-            "control": None,
-            "character": {
-                "type": ai_type, "pos": ai_pos, "last_dx": 1, "last_dy": 0, "respawn_timer": 0,
-                "attack_cooldown": 0, "shoot_cooldown": 0, "name": "AI", "index": len(players),
-                "ammo": max_ammo if max_ammo != -1 else float("inf"), "is_ai": True,
-            }
-        })
-
-    def choose_respawn_point():
-        valid_points = [sp for sp in spawn_points if not any(pygame.Rect(sp[0] - game_settings["player_size"], sp[1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2).colliderect(b) for b in buildings)]
-        if not valid_points:
-            return spawn_points[0].copy()
-        if not any(p["character"]["type"] == "survivor" for p in players):
-            return valid_points[0].copy()
-        return max(valid_points, key=lambda sp: min(math.hypot(sp[0] - p["character"]["pos"][0], sp[1] - p["character"]["pos"][1]) for p in players if p["character"]["type"] == "survivor" and p["character"]["respawn_timer"] == 0)).copy()
-
-    def ai_decision(player, players, bullets):
-        char = player["character"]
-        if char["respawn_timer"] > 0:
+def building_color(i):
+    return (100 + (i % 3) * 50, 100 + ((i + 1) % 3) * 50, 100 + ((i + 2) % 3) * 50)
+
+class WorldTiles:
+    """Ground and buildings pre-rendered in square tiles, each built the first time it is seen.
+
+    Only the tiles under the view are drawn, and at most max_tiles are kept,
+    so drawing and memory depend on the screen size rather than the world size.
+    """
+
+    def __init__(self, world, tile_size=512, max_tiles=128):
+        self.world = world
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.colors = {id(b): building_color(i) for i, b in enumerate(world.buildings)}
+
+    def tile(self, tx, ty):
+        key = (tx, ty)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        world, size = self.world, self.tile_size
+        area = pygame.Rect(tx * size, ty * size, size, size)
+        tile = pygame.Surface((size, size)).convert()
+        tile.fill(BLACK)
+        ground = pygame.Rect(world.left, world.top, world.right - world.left, world.bottom - world.top)
+        pygame.draw.rect(tile, GROUND_COLOR, ground.move(-area.x, -area.y))
+        for building in world.index.query(area):
+            pygame.draw.rect(tile, self.colors[id(building)], building.move(-area.x, -area.y))
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def draw(self, surface, view):
+        size = self.tile_size
+        for ty in range(view.top // size, (view.bottom - 1) // size + 1):
+            for tx in range(view.left // size, (view.right - 1) // size + 1):
+                surface.blit(self.tile(tx, ty), (tx * size - view.x, ty * size - view.y))
+
+class Camera:
+    """Screen-sized view of the world, centred on the players it follows and kept inside the world."""
+
+    def __init__(self, world, width, height):
+        self.bounds = pygame.Rect(0, 0, world.width, world.height)
+        self.rect = pygame.Rect(0, 0, width, height)
+
+    def follow(self, points):
+        if points:
+            self.rect.center = (int(sum(x for x, _ in points) / len(points)), int(sum(y for _, y in points) / len(points)))
+        self.rect.clamp_ip(self.bounds)
+
+def file_stamp():
+    """Local date and time to the millisecond, so files saved within a second get different names."""
+    now = time.time()
+    return time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+
+class PerfOverlay:
+    """Panel of per-phase frame timings, a frame time histogram and live counts.
+
+    Frames are only timed while the panel is shown. Its text is redrawn
+    every PERF_REFRESH seconds so the numbers stay readable.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stats = FrameStats()
+        self.panel = None
+        self.refreshed_at = 0
+
+    def draw(self, surface):
+        now = time.perf_counter()
+        if self.panel is None or now - self.refreshed_at >= PERF_REFRESH:
+            self.panel = self.build_panel()
+            self.refreshed_at = now
+        return surface.blit(self.panel, (surface.get_width() - self.panel.get_width() - 10, 10))
+
+    def build_panel(self):
+        summary = self.stats.summary()
+        panel = pygame.Surface((300, 360), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+        if not summary["frames"]:
+            panel.blit(render_text(name_font, "Collecting...", WHITE), (10, 10))
+            return panel
+        counts = summary["counts"]
+        cache = text_cache.stats()
+        lines = [(f"FPS {summary['fps']:.0f}", f"1% low {summary['one_percent_low_fps']:.0f}"),
+                 ("frame ms", f"{summary['frame_ms']['mean']:.1f} / p99 {summary['frame_ms']['p99']:.1f}")]
+        lines += [(phase, f"{summary['phase_ms'][phase]:.2f} ms") for phase in PHASES]
+        lines += [(name.replace("_", " "), str(counts[name])) for name in ("bullets", "entities", "draw_calls")]
+        lines += [("text cache", f"{cache['size']}, {cache['hits'] * 100 // max(1, cache['hits'] + cache['misses'])}% hit")]
+        for row, (label, value) in enumerate(lines):
+            # Values change on every refresh, so they skip the text cache rather than evict the HUD's text from it
+            panel.blit(render_text(name_font, label, WHITE), (10, 8 + row * 22))
+            panel.blit(name_font.render(value, True, WHITE), (150, 8 + row * 22))
+
+        # Frame time histogram, with the bins slower than the frame rate cap in red
+        histogram = self.stats.histogram()
+        bar_width, bottom = 280 // HISTOGRAM_BINS, 352
+        for k, count in enumerate(histogram.tolist()):
+            height = int(50 * count / histogram.max())
+            color = BULLET_COLOR if k * HISTOGRAM_BIN_MS >= 1000 / FRAME_RATE else INFECTED_COLOR
+            pygame.draw.rect(panel, color, (10 + k * bar_width, bottom - height, bar_width - 1, height))
+        return panel
+
+    def export(self):
+        if not self.stats.frames:
+            print("No frames timed yet: show the performance overlay first.")
             return
-        speed = game_settings["infected_speed"] if char["type"] == "infected" else game_settings["survivor_speed"]
-        accuracy = 0.5 + (game_settings["ai_difficulty"] - 1) * 0.25
-
-        def adjust_direction(dx, dy, pos):
-            rect = pygame.Rect(pos[0] + dx - game_settings["player_size"], pos[1] + dy - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2)
-            if any(rect.colliderect(b) for b in buildings):
-                if not any(pygame.Rect(pos[0] + dx - game_settings["player_size"], pos[1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2).colliderect(b) for b in buildings):
-                    return dx, 0
-                elif not any(pygame.Rect(pos[0] - game_settings["player_size"], pos[1] + dy - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2).colliderect(b) for b in buildings):
-                    return 0, dy
-                else:
-                    jitter = random.uniform(-speed * 0.5, speed * 0.5)
-                    return jitter, jitter if random.choice([True, False]) else -jitter
-            return dx, dy
-
-        if char["type"] == "infected":
-            target = min(
-                (p for p in players if p["character"]["type"] == "survivor" and p["character"]["respawn_timer"] == 0),
-                key=lambda p: math.hypot(p["character"]["pos"][0] - char["pos"][0], p["character"]["pos"][1] - char["pos"][1]),
-                default=None)
-            if target:
-                dx = target["character"]["pos"][0] - char["pos"][0]
-                dy = target["character"]["pos"][1] - char["pos"][1]
-                dist = max(1, math.hypot(dx, dy))
-                dx, dy = dx / dist * speed, dy / dist * speed
-                dx, dy = adjust_direction(dx, dy, char["pos"])
-                new_pos = [char["pos"][0] + dx, char["pos"][1] + dy]
-                if PLAYABLE_LEFT <= new_pos[0] <= PLAYABLE_RIGHT and PLAYABLE_TOP <= new_pos[1] <= PLAYABLE_BOTTOM:
-                    char["pos"] = new_pos
-                char["last_dx"], char["last_dy"] = dx, dy
-                if dist < INFECTED_ATTACK_RADIUS + game_settings["player_size"] and char["attack_cooldown"] <= action_cooldown_frames // 2 and random.random() < accuracy:
-                    char["attack_cooldown"] = action_cooldown_frames
-
-        else:  # Survivor AI
-            threat = min(
-                (p for p in players if p["character"]["type"] == "infected" and p["character"]["respawn_timer"] == 0),
-                key=lambda p: math.hypot(p["character"]["pos"][0] - char["pos"][0], p["character"]["pos"][1] - char["pos"][1]),
-                default=None)
-            if threat:
-                dx = threat["character"]["pos"][0] - char["pos"][0]
-                dy = threat["character"]["pos"][1] - char["pos"][1]
-                dist = max(1, math.hypot(dx, dy))
-                if dist < 200 and char["shoot_cooldown"] == 0 and char["ammo"] > 0 and random.random() < accuracy:
-                    angle = math.atan2(dy, dx)
-                    for offset in [-0.1, 0, 0.1]:
-                        bullet = {"x": char["pos"][0], "y": char["pos"][1], "dx": math.cos(angle + offset), "dy": math.sin(angle + offset)}
-                        bullets.append(bullet)
-                    char["shoot_cooldown"] = action_cooldown_frames
-                    char["ammo"] -= 1
-                elif dist < 300:
-                    dx, dy = -dx / dist * speed, -dy / dist * speed
-                    dx, dy = adjust_direction(dx, dy, char["pos"])
-                    new_pos = [char["pos"][0] + dx, char["pos"][1] + dy]
-                    if PLAYABLE_LEFT <= new_pos[0] <= PLAYABLE_RIGHT and PLAYABLE_TOP <= new_pos[1] <= PLAYABLE_BOTTOM:
-                        char["pos"] = new_pos
-                    char["last_dx"], char["last_dy"] = dx, dy
-
-    while True:
-        screen.fill(BLACK)
-        pygame.draw.rect(screen, GROUND_COLOR, (PLAYABLE_LEFT, PLAYABLE_TOP, PLAYABLE_RIGHT - PLAYABLE_LEFT, PLAYABLE_BOTTOM - PLAYABLE_TOP))
-        for i, building in enumerate(buildings):
-            pygame.draw.rect(screen, (100 + (i % 3) * 50, 100 + ((i + 1) % 3) * 50, 100 + ((i + 2) % 3) * 50), building)
+        os.makedirs(PERF_DIR, exist_ok=True)
+        path = os.path.join(PERF_DIR, f"perf-{file_stamp()}")
+        self.stats.export(path + ".json")
+        self.stats.export(path + ".csv")
+        print(f"Performance stats written to {path}.json and {path}.csv")
+
+perf_overlay = PerfOverlay()
+
+def game_world(num_humans, timer_duration, max_ammo, ai_survivors=0, ai_infected=0, seed=None, world_scale=1, horde=False):
+    names = [scheme["name"] for scheme in control_schemes]
+    state = new_match(get_world(world_scale), game_settings, num_humans, timer_duration, max_ammo, ai_survivors, ai_infected,
+                      names=names, tick_rate=SIM_TICK_RATE, seed=seed, horde=horde)
+    recorder = None
+    if RECORD_MATCHES:
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        path = os.path.join(RECORDINGS_DIR, f"match-{file_stamp()}.aprc")
+        recorder = InputRecorder(path, state, num_humans, ai_survivors, ai_infected, names, len(control_schemes))
+    try:
+        play_match(state, recorder)
+    finally:
+        if recorder:
+            recorder.close()
 
-        keys = pygame.key.get_pressed()
-        for player in players:
-            char = player["character"]
-            if char["is_ai"]:
-                ai_decision(player, players, bullets)
-            else:
-                speed = game_settings["survivor_speed"] if char["type"] == "survivor" else game_settings["infected_speed"]
-                dx = (keys[player["control"]["right"]] - keys[player["control"]["left"]]) * speed
-                dy = (keys[player["control"]["down"]] - keys[player["control"]["up"]]) * speed
-                if dx or dy:
-                    char["last_dx"], char["last_dy"] = dx, dy
-                new_pos_x = [char["pos"][0] + dx, char["pos"][1]]
-                new_pos_y = [char["pos"][0], char["pos"][1] + dy]
-                rect_x = pygame.Rect(new_pos_x[0] - game_settings["player_size"], new_pos_x[1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2)
-                rect_y = pygame.Rect(new_pos_y[0] - game_settings["player_size"], new_pos_y[1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2)
-                if not any(rect_x.colliderect(b) for b in buildings):
-                    char["pos"][0] = new_pos_x[0]
-                if not any(rect_y.colliderect(b) for b in buildings):
-                    char["pos"][1] = new_pos_y[1]
-                char["pos"][0] = max(PLAYABLE_LEFT + game_settings["player_size"], min(PLAYABLE_RIGHT - game_settings["player_size"], char["pos"][0]))
-                char["pos"][1] = max(PLAYABLE_TOP + game_settings["player_size"], min(PLAYABLE_BOTTOM - game_settings["player_size"], char["pos"][1]))
-
-            if char["respawn_timer"] > 0:
-                char["respawn_timer"] -= 1
-                if char["respawn_timer"] == 0:
-                    char["pos"] = choose_respawn_point()
-            if char["attack_cooldown"] > 0:
-                char["attack_cooldown"] -= 1
-            if char["shoot_cooldown"] > 0:
-                char["shoot_cooldown"] -= 1
-
-        for bullet in bullets[:]:
-            bullet["x"] += bullet["dx"] * game_settings["bullet_speed"]
-            bullet["y"] += bullet["dy"] * game_settings["bullet_speed"]
-            bullet_rect = pygame.Rect(bullet["x"] - 5, bullet["y"] - 5, 10, 10)
-            if any(bullet_rect.colliderect(b) for b in buildings) or not (PLAYABLE_LEFT < bullet["x"] < PLAYABLE_RIGHT and PLAYABLE_TOP < bullet["y"] < PLAYABLE_BOTTOM):
-                bullets.remove(bullet)
-                continue
-            for player in players:
-                char = player["character"]
-                if char["type"] == "infected" and char["respawn_timer"] == 0:
-                    char_rect = pygame.Rect(char["pos"][0] - game_settings["player_size"], char["pos"][1] - game_settings["player_size"], game_settings["player_size"] * 2, game_settings["player_size"] * 2)
-                    if bullet_rect.colliderect(char_rect):
-                        bullets.remove(bullet)
-                        char["respawn_timer"] = 300
-                        char["pos"] = [-100, -100]
-                        break
-
-        pulse_timer = (pulse_timer + 1) % 60
-        pulsed_size = int(game_settings["player_size"] * (1 + 0.1 * math.sin(pulse_timer * math.pi / 30)))
-        for player in players:
-            char = player["character"]
-            if char["respawn_timer"] == 0:
-                color = INFECTED_COLOR if char["type"] == "infected" else player_skins[char["index"]]
-                pygame.draw.circle(screen, color, (int(char["pos"][0]), int(char["pos"][1])), pulsed_size)
-                name_text = name_font.render(char["name"], True, WHITE)
-                screen.blit(name_text, (char["pos"][0] - name_text.get_width() // 2, char["pos"][1] - pulsed_size - 20))
-            if char["type"] == "infected" and char["attack_cooldown"] == 0:
-                if (not char["is_ai"] and player["control"] and keys[player["control"]["action"]]) or (char["is_ai"]):
-                    screen.blit(radius_surface, (char["pos"][0] - INFECTED_ATTACK_RADIUS, char["pos"][1] - INFECTED_ATTACK_RADIUS))
-                    for other in players:
-                        if other["character"]["type"] == "survivor" and other["character"]["respawn_timer"] == 0:
-                            dist = math.hypot(other["character"]["pos"][0] - char["pos"][0], other["character"]["pos"][1] - char["pos"][1])
-                            if dist < INFECTED_ATTACK_RADIUS + game_settings["player_size"]:
-                                other["character"]["type"] = "infected"
-                    char["attack_cooldown"] = action_cooldown_frames
-
-        for bullet in bullets:
-            pygame.draw.circle(screen, BULLET_COLOR, (int(bullet["x"]), int(bullet["y"])), 5)
-
-        elapsed = (pygame.time.get_ticks() - start_time) / 1000
-        time_left = max(0, timer_duration * 60 - elapsed)
-        screen.blit(font.render(f"Time: {int(time_left)}s", True, WHITE), (10, 10))
-        if max_ammo != -1:
-            for i, player in enumerate(players):
-                if player["character"]["type"] == "survivor":
-                    screen.blit(font.render(f"{player['character']['name']} Ammo: {player['character']['ammo']}", True, WHITE), (10, 50 + i * 40))
-
-        if all(p["character"]["type"] == "infected" for p in players):
-            screen.blit(font.render("Infected Win!", True, WHITE), (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2))
-            pygame.display.flip()
-            pygame.time.wait(2000)
-            return
-        if time_left <= 0 and any(p["character"]["type"] == "survivor" for p in players):
-            screen.blit(font.render("Survivors Win!", True, WHITE), (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2))
-            pygame.display.flip()
-            pygame.time.wait(2000)
-            return
+def play_match(state, recorder=None):
+    clock = pygame.time.Clock()
+    tick_time = 1 / state.tick_rate
+    accumulator = 0
+    ents = state.entities
+    previous = None  # Positions and live players before the latest tick, for interpolation
+    fired = set()
+    tiles = WorldTiles(state.world)
+    camera = Camera(state.world, SCREEN_WIDTH, SCREEN_HEIGHT)
+    view_layer = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()  # Tiles under the camera
+    view_at = None
+    dirty = []  # Screen areas drawn over last frame
+    full_redraw = True
+    stats = perf_overlay.stats = FrameStats()
+    frame_end = time.perf_counter()
 
-        pygame.display.flip()
-        clock.tick(60)
+    while True:
+        profiling = perf_overlay.enabled
+        if profiling:
+            mark = time.perf_counter()
 
+        # Input
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -708,16 +675,118 @@ def game_world(num_players, timer_duration, max_ammo, include_ai):
                 if event.key == pygame.K_ESCAPE:
                     if not pause_menu():
                         return
-                for player in players:
-                    char = player["character"]
-                    if not char["is_ai"] and event.key == player["control"]["action"] and char["type"] == "survivor" and char["shoot_cooldown"] == 0 and char["ammo"] > 0:
-                        angle = math.atan2(char["last_dy"], char["last_dx"])
-                        for offset in [-0.2618, 0, 0.2618]:
-                            bullet = {"x": char["pos"][0], "y": char["pos"][1], "dx": math.cos(angle + offset), "dy": math.sin(angle + offset)}
-                            bullets.append(bullet)
-                        char["shoot_cooldown"] = action_cooldown_frames
-                        char["ammo"] -= 1
+                    full_redraw = True
+                    clock.tick()
+                    frame_end = time.perf_counter()
+                if event.key == PERF_OVERLAY_KEY:
+                    perf_overlay.enabled = not perf_overlay.enabled
+                    full_redraw = True
+                if event.key == PERF_EXPORT_KEY:
+                    perf_overlay.export()
+                for i, scheme in enumerate(control_schemes):
+                    if event.key == scheme["action"]:
+                        fired.add(i)
+        keys = pygame.key.get_pressed()
+        if profiling:
+            stats.add("input", time.perf_counter() - mark)
+
+        # Simulation: run as many fixed ticks as the elapsed time covers
+        state.phase_times = stats.phases if profiling else None
+        accumulator += min(clock.tick(FRAME_RATE) / 1000, MAX_FRAME_TIME)
+        attacks = []
+        while accumulator >= tick_time and not state.winner:
+            inputs = [{"left": keys[scheme["left"]], "right": keys[scheme["right"]], "up": keys[scheme["up"]],
+                       "down": keys[scheme["down"]], "action": keys[scheme["action"]], "fire": i in fired}
+                      for i, scheme in enumerate(control_schemes)]
+            fired.clear()
+            if recorder:
+                recorder.record(inputs)
+            previous = ents.x.copy(), ents.y.copy(), ents.alive()
+            step(state, inputs)
+            attacks.extend(state.attacks)
+            accumulator -= tick_time
+        alpha = accumulator / tick_time
+        if profiling:
+            mark = time.perf_counter()
+
+        # Interpolated positions of live players, and a camera following the humans among them
+        xs, ys = ents.x, ents.y
+        if previous:
+            prev_x, prev_y, was_alive = previous
+            xs = np.where(was_alive, prev_x + (xs - prev_x) * alpha, xs)
+            ys = np.where(was_alive, prev_y + (ys - prev_y) * alpha, ys)
+        alive = ents.alive()
+        humans = alive & ~ents.is_ai
+        followed = humans if humans.any() else alive
+        camera.follow(list(zip(xs[followed].tolist(), ys[followed].tolist())))
+        view = camera.rect
+        if view.topleft != view_at:
+            tiles.draw(view_layer, view)
+            view_at = view.topleft
+            full_redraw = True
+
+        # Render: restore the view layer under last frame's drawings, then draw what is in view on top
+        if full_redraw:
+            screen.blit(view_layer, (0, 0))
+        else:
+            for rect in dirty:
+                screen.blit(view_layer, rect, rect)
+        drawn = []
+
+        pulsed_size = int(state.config.player_size * (1 + 0.1 * math.sin(pygame.time.get_ticks() / 1000 * 2 * math.pi)))
+        visible = view.inflate(pulsed_size * 2 + 200, pulsed_size * 2 + 100)  # Room for name labels
+        in_view = alive & (xs >= visible.left) & (xs < visible.right) & (ys >= visible.top) & (ys < visible.bottom)
+        for i in np.flatnonzero(in_view).tolist():
+            x, y = xs[i] - view.x, ys[i] - view.y
+            color = INFECTED_COLOR if ents.infected[i] else player_skins[i % len(player_skins)]
+            drawn.append(pygame.draw.circle(screen, color, (int(x), int(y)), pulsed_size))
+            if ents.names[i]:
+                name_text = render_text(name_font, ents.names[i], WHITE)
+                drawn.append(screen.blit(name_text, (x - name_text.get_width() // 2, y - pulsed_size - 20)))
+        for x, y in attacks:
+            drawn.append(screen.blit(radius_surface, (x - view.x - INFECTED_ATTACK_RADIUS, y - view.y - INFECTED_ATTACK_RADIUS)))
+
+        # Bullets move in straight lines, so step them back to where they were between ticks
+        back = state.config.bullet_step * (1 - alpha)
+        bullets_x = state.bullets.x - state.bullets.dx * back
+        bullets_y = state.bullets.y - state.bullets.dy * back
+        in_view = (bullets_x > view.left - 5) & (bullets_x < view.right + 5) & (bullets_y > view.top - 5) & (bullets_y < view.bottom + 5)
+        for x, y in zip(bullets_x[in_view] - view.x, bullets_y[in_view] - view.y):
+            drawn.append(pygame.draw.circle(screen, BULLET_COLOR, (int(x), int(y)), 5))
+
+        drawn.append(screen.blit(render_text(font, f"Time: {int(state.time_left)}s", WHITE), (10, 10)))
+        if state.max_ammo != -1:
+            for i in np.flatnonzero(~ents.infected & ~ents.is_ai).tolist():
+                drawn.append(screen.blit(render_text(font, f"{ents.names[i]} Ammo: {ents.ammo[i]}", WHITE), (10, 50 + i * 40)))
+
+        if state.winner:
+            message = "Infected Win!" if state.winner == "infected" else "Survivors Win!"
+            screen.blit(render_text(font, message, WHITE), (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2))
+            pygame.display.flip()
+            pygame.time.wait(2000)
+            return
+
+        if profiling:
+            drawn.append(perf_overlay.draw(screen))
+            draw_calls = (1 if full_redraw else len(dirty)) + len(drawn)
+            now = time.perf_counter()
+            stats.add("render", now - mark)
+            mark = now
+        if full_redraw:
+            pygame.display.flip()
+            full_redraw = False
+        else:
+            pygame.display.update(dirty + drawn)
+        dirty = drawn
+        if profiling:
+            now = time.perf_counter()
+            stats.add("flip", now - mark)
+            stats.end_frame(now - frame_end, bullets=len(state.bullets), entities=len(ents), draw_calls=draw_calls)
+            frame_end = now
+        else:
+            frame_end = time.perf_counter()
 
 if __name__ == "__main__":
+    init()
     main_menu()
 
@@ -0,0 +1,4 @@
+"""Display-free game engine behind GrokApoc.py."""
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
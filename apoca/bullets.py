@@ -0,0 +1,207 @@
+"""Struct-of-arrays bullet pool with batched movement, culling and hit tests."""
+import numpy as np
+
+from apoca.spatial import SpatialHash
+
+BULLET_HALF_SIZE = 5
+BULLET_CAPACITY = 1024
+OVERFLOW_GROW = "grow"  # Double the pool
+OVERFLOW_DROP_NEW = "drop_new"  # Refuse the new bullet
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # Replace the oldest live bullet
+OVERFLOW_POLICIES = (OVERFLOW_GROW, OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLDEST)
+
+
+class BulletStore:
+    """All live bullets of a match in preallocated parallel NumPy arrays.
+
+    Live bullets fill the first len(self) slots of each array and the rest
+    are free. spawn() writes into the first free slot, and removing bullets
+    moves live bullets from the end into the holes they leave, so neither
+    allocates. x, y, dx, dy and serials are views of the live slots. Slot order
+    changes as bullets are removed, so each bullet keeps a spawn serial to
+    break ties between hits in spawn order.
+
+    When every slot is taken, overflow decides what happens to a new
+    bullet: OVERFLOW_GROW doubles the pool, OVERFLOW_DROP_NEW refuses it and
+    OVERFLOW_DROP_OLDEST puts it in place of the oldest live bullet.
+    """
+
+    def __init__(self, capacity=BULLET_CAPACITY, overflow=OVERFLOW_GROW):
+        if capacity < 1:
+            raise ValueError(f"Bullet pool capacity must be at least 1, not {capacity}")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown bullet overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.overflow = overflow
+        self.count = 0
+        self.next_serial = 0
+        self.peak = self.spawned = self.dropped = self.grown = 0
+        self._allocate(capacity)
+        self._targets = None  # SpatialHash over the targets of the current update
+
+    def _allocate(self, capacity):
+        count = self.count
+        pool = np.zeros((4, capacity))  # x, y, dx, dy
+        serials = np.zeros(capacity, dtype=np.int64)
+        if count:
+            pool[:, :count] = self._pool[:, :count]
+            serials[:count] = self._serials[:count]
+        self._pool, self._serials = pool, serials
+
+    @property
+    def x(self):
+        return self._pool[0, :self.count]
+
+    @property
+    def y(self):
+        return self._pool[1, :self.count]
+
+    @property
+    def dx(self):
+        return self._pool[2, :self.count]
+
+    @property
+    def dy(self):
+        return self._pool[3, :self.count]
+
+    @property
+    def serials(self):
+        """Spawn serial of each live bullet, unique within a match."""
+        return self._serials[:self.count]
+
+    @property
+    def capacity(self):
+        return self._pool.shape[1]
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, x, y, dx, dy):
+        slot = self.count
+        if slot == self.capacity:
+            if self.overflow == OVERFLOW_DROP_NEW:
+                self.dropped += 1
+                return
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                slot = int(self._serials[:self.count].argmin())
+                self.dropped += 1
+            else:
+                self._allocate(self.capacity * 2)
+                self.grown += 1
+        pool = self._pool
+        pool[0, slot], pool[1, slot], pool[2, slot], pool[3, slot] = x, y, dx, dy
+        self._serials[slot] = self.next_serial
+        self.next_serial += 1
+        self.spawned += 1
+        if slot == self.count:
+            self.count += 1
+            self.peak = max(self.peak, self.count)
+
+    def _keep(self, mask):
+        """Remove the live bullets where mask is False, filling their slots from the end of the pool."""
+        kept = int(mask.sum())
+        holes = np.flatnonzero(~mask[:kept])
+        movers = kept + np.flatnonzero(mask[kept:])
+        self._pool[:, holes] = self._pool[:, movers]
+        self._serials[holes] = self._serials[movers]
+        self.count = kept
+
+    def save(self):
+        """Copy of the live bullets and spawn counters, for restore()."""
+        return self._pool[:, :self.count].copy(), self._serials[:self.count].copy(), self.next_serial, self.spawned, self.dropped
+
+    def restore(self, saved):
+        pool, serials, self.next_serial, self.spawned, self.dropped = saved
+        count = len(serials)
+        if count > self.capacity:
+            self._allocate(count)
+        self._pool[:, :count] = pool
+        self._serials[:count] = serials
+        self.count = count
+
+    def stats(self):
+        return {"capacity": self.capacity, "live": self.count, "peak": self.peak, "spawned": self.spawned,
+                "dropped": self.dropped, "grown": self.grown}
+
+    def update(self, speed, world, targets, half_size):
+        """Move every bullet one tick and resolve what it runs into.
+
+        Each bullet sweeps its square along the segment it travels this
+        tick, so what it hits doesn't depend on how far it moves per tick.
+        A bullet is removed where it first touches a building or its centre
+        leaves the playable area. Before that, it may hit one of targets, a
+        list of (x, y) centres of square hitboxes with the given half size.
+        Contacts are resolved in the order they happen along the tick, so
+        each bullet hits the first target it reaches that no bullet reached
+        before it. Ties go to the older bullet, then to the first target in
+        list order. Returns the indices of the targets hit.
+        """
+        if not self.count:
+            return []
+        x, y, dx, dy = self._pool[:, :self.count]
+        step_x, step_y = dx * speed, dy * speed
+        start_x, start_y = x.copy(), y.copy()
+        x += step_x
+        y += step_y
+
+        # Where along its path each bullet stops: leaving the playable area or entering a building
+        with np.errstate(divide="ignore"):
+            out_x = np.where(step_x > 0, (world.right - start_x) / step_x,
+                             np.where(step_x < 0, (world.left - start_x) / step_x, np.inf))
+            out_y = np.where(step_y > 0, (world.bottom - start_y) / step_y,
+                             np.where(step_y < 0, (world.top - start_y) / step_y, np.inf))
+        end = np.minimum(out_x, out_y)
+        walls = world.building_bounds
+        if len(walls):
+            h = BULLET_HALF_SIZE
+            wall = segment_entry(start_x[:, None], start_y[:, None], step_x[:, None], step_y[:, None],
+                                 walls[:, 0] - h, walls[:, 1] - h, walls[:, 2] + h, walls[:, 3] + h)
+            end = np.minimum(end, wall.min(axis=1))
+        alive = end > 1
+
+        hit = []
+        if len(targets):
+            centres = np.array(targets, dtype=float).reshape(-1, 2)
+            if self._targets is None:
+                self._targets = SpatialHash(world.width, world.height)
+            self._targets.rebuild(centres[:, 0], centres[:, 1], np.arange(len(centres)))
+            reach = speed / 2 + BULLET_HALF_SIZE + half_size + 1
+            bullets, hits = self._targets.candidates(start_x + step_x / 2, start_y + step_y / 2, reach)
+            h = BULLET_HALF_SIZE + half_size
+            tx, ty = centres[hits, 0], centres[hits, 1]
+            when = segment_entry(start_x[bullets], start_y[bullets], step_x[bullets], step_y[bullets],
+                                 tx - h, ty - h, tx + h, ty + h)
+            found = when < end[bullets]
+            bullets, hits, when = bullets[found], hits[found], when[found]
+            order = np.lexsort((hits, self._serials[bullets], when))
+            spent = set()  # Bullets that hit a target, even those that would have stopped later this tick
+            for b, t in zip(bullets[order].tolist(), hits[order].tolist()):
+                if b not in spent and t not in hit:
+                    hit.append(t)
+                    spent.add(b)
+                    alive[b] = False
+        if not alive.all():
+            self._keep(alive)
+        return hit
+
+
+def segment_entry(x, y, dx, dy, left, top, right, bottom):
+    """How far along the segments from (x, y) to (x + dx, y + dy) each first enters a rect, or inf if it doesn't.
+
+    The result is a fraction of the segment in [0, 1); 0 means the segment
+    starts inside. Rects are open, so touching an edge is not entering. All
+    arguments are arrays broadcast against each other.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        near_x, far_x = _slab(x, dx, left, right)
+        near_y, far_y = _slab(y, dy, top, bottom)
+    entry = np.maximum(np.maximum(near_x, near_y), 0)
+    return np.where((entry < np.minimum(far_x, far_y)) & (entry < 1), entry, np.inf)
+
+
+def _slab(p, d, low, high):
+    """Fractions of the way along p + t * d where it enters and leaves the open interval (low, high)."""
+    a, b = (low - p) / d, (high - p) / d
+    inside = (low < p) & (p < high)
+    near = np.where(d == 0, np.where(inside, -np.inf, np.inf), np.minimum(a, b))
+    far = np.where(d == 0, np.inf, np.maximum(a, b))
+    return near, far
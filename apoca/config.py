@@ -0,0 +1,117 @@
+"""Game parameters: their defaults and limits, the settings file, and the read-only config of a match.
+
+Parameters are kept in the units of game_settings.json (pixels per 1/60 s
+and seconds). MatchConfig checks them once when a match is created and
+converts them to the per-tick values the simulation reads every tick.
+"""
+import json
+
+from apoca.bullets import BULLET_CAPACITY, OVERFLOW_GROW, OVERFLOW_POLICIES
+
+SPEED_UNIT_RATE = 60  # Settings speeds are pixels per tick at this rate
+RESPAWN_TIME = 5.0
+INFECTED_ATTACK_RADIUS = 50
+
+DEFAULT_SETTINGS = {
+    "player_size": 20,
+    "survivor_speed": 5,
+    "infected_speed": 7,
+    "bullet_speed": 10,
+    "action_cooldown": 1.0,
+    "ai_difficulty": 1,  # 1=Easy, 2=Medium, 3=Hard
+}
+SETTING_LIMITS = {  # (lowest, highest, step in the parameters menu)
+    "player_size": (10, 200, 5),
+    "survivor_speed": (1, 20, 1),
+    "infected_speed": (1, 20, 1),
+    "bullet_speed": (1, 20, 1),
+    "action_cooldown": (0, 2, 0.5),
+    "ai_difficulty": (1, 3, 1),
+}
+
+
+def check_setting(key, value):
+    """Raise ValueError unless value is a number within the limits of setting key."""
+    if key not in SETTING_LIMITS:
+        raise ValueError(f"Unknown setting {key!r}")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Setting {key!r} must be a number, not {value!r}")
+    low, high, _ = SETTING_LIMITS[key]
+    if not low <= value <= high:
+        raise ValueError(f"Setting {key!r} must be between {low} and {high}, not {value}")
+
+
+def load_settings(path):
+    """Settings saved at path over the defaults, skipping (with a warning) any that are invalid."""
+    settings = DEFAULT_SETTINGS.copy()
+    try:
+        with open(path, "r") as f:
+            loaded = json.load(f)
+    except FileNotFoundError:
+        return settings
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Warning: Failed to load {path} ({e}). Using defaults.")
+        return settings
+    for key, value in loaded.items():
+        try:
+            check_setting(key, value)
+        except ValueError as e:
+            print(f"Warning: {e} in {path}. Ignoring it.")
+            continue
+        settings[key] = value
+    return settings
+
+
+def save_settings(settings, path):
+    with open(path, "w") as f:
+        json.dump(settings, f)
+
+
+class MatchConfig:
+    """Validated game parameters of one match, with their per-tick values precomputed.
+
+    Raises ValueError for a missing or invalid setting. Speeds ending in
+    _step are pixels per tick and durations ending in _ticks are ticks at
+    tick_rate. bullet_capacity and bullet_overflow size the match's bullet
+    pool and say what happens when it is full (see bullets.BulletStore).
+    Attributes can't be changed once built.
+    """
+
+    def __init__(self, settings, tick_rate, bullet_capacity=BULLET_CAPACITY, bullet_overflow=OVERFLOW_GROW):
+        for key in DEFAULT_SETTINGS:
+            if key not in settings:
+                raise ValueError(f"Missing setting {key!r}")
+            check_setting(key, settings[key])
+        if tick_rate <= 0:
+            raise ValueError(f"Tick rate must be positive, not {tick_rate}")
+        if isinstance(bullet_capacity, bool) or not isinstance(bullet_capacity, int) or bullet_capacity < 1:
+            raise ValueError(f"Bullet pool capacity must be a whole number of at least 1, not {bullet_capacity!r}")
+        if bullet_overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown bullet overflow policy {bullet_overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        speed_scale = SPEED_UNIT_RATE / tick_rate
+        size = settings["player_size"]
+        values = {key: settings[key] for key in DEFAULT_SETTINGS}
+        values.update(
+            tick_rate=tick_rate,
+            speed_scale=speed_scale,
+            player_diameter=size * 2,
+            attack_radius=INFECTED_ATTACK_RADIUS + size,  # Reach of an infected attack, from the attacker's centre
+            attack_radius_sq=(INFECTED_ATTACK_RADIUS + size) ** 2,
+            survivor_step=settings["survivor_speed"] * speed_scale,
+            infected_step=settings["infected_speed"] * speed_scale,
+            bullet_step=settings["bullet_speed"] * speed_scale,
+            action_cooldown_ticks=int(settings["action_cooldown"] * tick_rate),
+            respawn_ticks=int(RESPAWN_TIME * tick_rate),
+            ai_accuracy=0.5 + (settings["ai_difficulty"] - 1) * 0.25,
+            bullet_capacity=bullet_capacity,
+            bullet_overflow=bullet_overflow,
+        )
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"MatchConfig is read-only (tried to set {name})")
+
+    def settings(self):
+        """The game parameters, as saved in game_settings.json."""
+        return {key: getattr(self, key) for key in DEFAULT_SETTINGS}
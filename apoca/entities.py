@@ -0,0 +1,51 @@
+"""Struct-of-arrays character store: one packed column per attribute."""
+import numpy as np
+
+UNLIMITED_AMMO = -1
+COLUMNS = ("x", "y", "last_dx", "last_dy", "vx", "vy", "infected", "is_ai",
+           "respawn_timer", "attack_cooldown", "shoot_cooldown", "ammo")
+
+
+class Entities:
+    """All characters of a match as parallel NumPy columns, one row per player.
+
+    Rows are in player order (humans, then AI survivors, then AI infected)
+    and row i is driven by inputs[i]. Characters waiting to respawn are
+    parked off the map. An ammo of UNLIMITED_AMMO never runs out.
+    """
+
+    def __init__(self, count):
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.last_dx = np.ones(count)  # Last movement, which a human's shot follows
+        self.last_dy = np.zeros(count)
+        self.vx = np.zeros(count)  # Velocity of steered agents
+        self.vy = np.zeros(count)
+        self.infected = np.zeros(count, dtype=bool)
+        self.is_ai = np.zeros(count, dtype=bool)
+        self.respawn_timer = np.zeros(count, dtype=np.int32)
+        self.attack_cooldown = np.zeros(count, dtype=np.int32)
+        self.shoot_cooldown = np.zeros(count, dtype=np.int32)
+        self.ammo = np.zeros(count, dtype=np.int32)
+        self.names = [""] * count
+
+    def __len__(self):
+        return len(self.x)
+
+    def alive(self):
+        return self.respawn_timer == 0
+
+    def live_survivors(self):
+        return ~self.infected & (self.respawn_timer == 0)
+
+    def save(self):
+        """Copies of every column, for restore(). Names never change during a match and are left out."""
+        return tuple(getattr(self, name).copy() for name in COLUMNS)
+
+    def restore(self, saved):
+        for name, column in zip(COLUMNS, saved):
+            getattr(self, name)[:] = column
+
+    def positions(self, rows):
+        """(x, y) tuples of the given rows."""
+        return list(zip(self.x[rows].tolist(), self.y[rows].tolist()))
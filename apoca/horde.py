@@ -0,0 +1,122 @@
+"""Batched steering for horde mode, where hundreds of AI infected chase the survivors.
+
+Every horde agent is steered in the same few NumPy passes over the entity
+columns: seek its nearest survivor (along the flow field when it is far),
+keep apart from the agents around it and keep off the buildings. Steering
+turns each agent's velocity toward the sum of those pulls, and the velocity
+then moves it, sliding along any wall in the way.
+"""
+import numpy as np
+
+from apoca.navigation import FLOW_DIRECT_RANGE
+
+HORDE_TARGET_AGENTS = 300  # Horde size the mode is built to hold at 60 FPS
+SEPARATION_RANGE = 2.0  # Agents closer than this many player sizes push apart
+WALL_RANGE = 1.5  # Agents closer than this many player sizes to a building turn away from it
+SEPARATION_WEIGHT = 1.5
+WALL_WEIGHT = 2.0
+STEERING_RATE = 0.25  # Share of the gap to the wanted velocity closed per 1/60 s
+GOLDEN_ANGLE = 2.399963  # Spreads agents stacked on one point in different directions
+SPAWN_CLEARANCE = 300  # No horde agent starts closer than this to a survivor
+
+
+def horde_positions(state, x, y, count):
+    """count free spots for horde agents, spiralling out from (x, y) packed about a body apart.
+
+    Spots inside buildings or within SPAWN_CLEARANCE of a live survivor are skipped.
+    """
+    world, ents, size = state.world, state.entities, state.config.player_size
+    survivors = ents.live_survivors()
+    sx, sy = ents.x[survivors], ents.y[survivors]
+    found_x, found_y = np.empty(0), np.empty(0)
+    tried = 0
+    while len(found_x) < count and tried < count * 64:
+        k = np.arange(tried, tried + count * 4)
+        radius = size * np.sqrt(k)
+        px, py = x + radius * np.cos(k * GOLDEN_ANGLE), y + radius * np.sin(k * GOLDEN_ANGLE)
+        free = ((px >= world.left + size) & (px <= world.right - size) & (py >= world.top + size) &
+                (py <= world.bottom - size) & ~world.squares_collide(px, py, size))
+        if len(sx):
+            free &= ((px[:, None] - sx) ** 2 + (py[:, None] - sy) ** 2).min(axis=1) >= SPAWN_CLEARANCE ** 2
+        found_x, found_y = np.concatenate((found_x, px[free])), np.concatenate((found_y, py[free]))
+        tried += count * 4
+    if len(found_x) < count:  # Map too crowded: stack the rest on the spawn point
+        found_x = np.concatenate((found_x, np.full(count - len(found_x), float(x))))
+        found_y = np.concatenate((found_y, np.full(count - len(found_y), float(y))))
+    return found_x[:count], found_y[:count]
+
+
+def steer_horde(state, targets):
+    """Steer and move every live AI infected by one tick.
+
+    targets is the nearest opponent's row for every entity row, as returned
+    by nearest_opponents(), or -1 where there is none.
+    """
+    ents, world, config = state.entities, state.world, state.config
+    rows = np.flatnonzero(ents.is_ai & ents.infected & ents.alive())
+    if not len(rows):
+        return
+    size = config.player_size
+    speed = config.infected_step
+    x, y = ents.x[rows], ents.y[rows]
+
+    # Seek: straight at a close target, along the flow field otherwise
+    target = np.asarray(targets)[rows]
+    chasing = target >= 0
+    dx = np.where(chasing, ents.x[target] - x, 0)
+    dy = np.where(chasing, ents.y[target] - y, 0)
+    dist = np.maximum(np.hypot(dx, dy), 1)
+    seek_x, seek_y = dx / dist, dy / dist
+    if state.flow is not None:
+        flow_x, flow_y, valid = state.flow.directions(x, y)
+        far = chasing & valid & (dist > FLOW_DIRECT_RANGE)
+        seek_x = np.where(far, flow_x, seek_x)
+        seek_y = np.where(far, flow_y, seek_y)
+
+    # Separation: push away from agents in range, harder the closer they are
+    reach = SEPARATION_RANGE * size
+    state.spatial.rebuild(ents.x, ents.y, rows)
+    queries, others = state.spatial.within_radius(x, y, reach)
+    apart = others != rows[queries]
+    queries, others = queries[apart], others[apart]
+    ox, oy = x[queries] - ents.x[others], y[queries] - ents.y[others]
+    gap = np.hypot(ox, oy)
+    stacked = gap == 0
+    angle = rows[queries] * GOLDEN_ANGLE
+    push = (1 - gap / reach) / np.where(stacked, 1, gap)
+    sep_x = np.bincount(queries, np.where(stacked, np.cos(angle), ox * push), minlength=len(rows))
+    sep_y = np.bincount(queries, np.where(stacked, np.sin(angle), oy * push), minlength=len(rows))
+
+    # Wall avoidance: push away from the closest point of every building in range
+    wall_x = wall_y = 0
+    walls = world.building_bounds
+    if len(walls):
+        wx = x[:, None] - np.clip(x[:, None], walls[:, 0], walls[:, 2])
+        wy = y[:, None] - np.clip(y[:, None], walls[:, 1], walls[:, 3])
+        gap = np.hypot(wx, wy)
+        margin = size * (1 + WALL_RANGE)
+        push = np.clip(1 - gap / margin, 0, None) / np.maximum(gap, 1e-9)
+        wall_x = (wx * push).sum(axis=1)
+        wall_y = (wy * push).sum(axis=1)
+
+    # Turn toward the wanted velocity, no faster than the infected speed
+    want_x = (seek_x + SEPARATION_WEIGHT * sep_x + WALL_WEIGHT * wall_x) * speed
+    want_y = (seek_y + SEPARATION_WEIGHT * sep_y + WALL_WEIGHT * wall_y) * speed
+    rate = min(1, STEERING_RATE * config.speed_scale)
+    vx = ents.vx[rows] + (want_x - ents.vx[rows]) * rate
+    vy = ents.vy[rows] + (want_y - ents.vy[rows]) * rate
+    scale = speed / np.maximum(np.hypot(vx, vy), speed)
+    vx, vy = vx * scale, vy * scale
+
+    # Move each axis separately, stopping the axis that would enter a building
+    blocked = world.squares_collide(x + vx, y, size)
+    x = np.where(blocked, x, x + vx)
+    vx[blocked] = 0
+    blocked = world.squares_collide(x, y + vy, size)
+    y = np.where(blocked, y, y + vy)
+    vy[blocked] = 0
+    ents.x[rows] = np.clip(x, world.left + size, world.right - size)
+    ents.y[rows] = np.clip(y, world.top + size, world.bottom - size)
+    ents.vx[rows], ents.vy[rows] = vx, vy
+    moving = (vx != 0) | (vy != 0)
+    ents.last_dx[rows[moving]], ents.last_dy[rows[moving]] = vx[moving], vy[moving]
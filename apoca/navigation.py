@@ -0,0 +1,132 @@
+"""Flow-field pathfinding on the world's navigation grid.
+
+One breadth-first search from every live survivor gives each free grid cell
+its distance to the nearest survivor; each cell then points at its closest
+neighbour. Every infected agent reads its direction from the same field, so
+the cost of pathing does not grow with the number of chasers. The search
+expands its whole wavefront at once with NumPy masks, and can be run a few
+waves at a time so no single tick pays for all of it.
+"""
+import math
+
+import numpy as np
+
+from apoca.world import GRID_CELL
+
+MAX_FLOW_CELLS = 20000  # Larger maps search a coarser grid so an update stays cheap
+FLOW_DIRECT_RANGE = 100  # Agents this close to their target steer straight at it
+
+# Neighbour offsets (dx, dy) searched when picking a cell's direction
+NEIGHBOURS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+class FlowField:
+    def __init__(self, world, clearance):
+        """Field over world.grid, with buildings grown by clearance pixels so agents fit through."""
+        self.world = world
+        grid = np.asarray(world.grid, dtype=bool)
+        factor = max(1, math.ceil(math.sqrt(grid.size / MAX_FLOW_CELLS)))
+        if factor > 1:
+            # A coarse cell is blocked if any fine cell inside it is
+            height, width = -(-grid.shape[0] // factor), -(-grid.shape[1] // factor)
+            padded = np.zeros((height * factor, width * factor), dtype=bool)
+            padded[:grid.shape[0], :grid.shape[1]] = grid
+            grid = padded.reshape(height, factor, width, factor).any(axis=(1, 3))
+        self.cell_size = GRID_CELL * factor
+        self.height, self.width = grid.shape
+        reach = math.ceil(clearance / self.cell_size)
+        blocked = grid.copy()
+        for oy in range(-reach, reach + 1):
+            for ox in range(-reach, reach + 1):
+                blocked[max(0, oy):self.height + min(0, oy), max(0, ox):self.width + min(0, ox)] |= \
+                    grid[max(0, -oy):self.height + min(0, -oy), max(0, -ox):self.width + min(0, -ox)]
+        # Distances are searched on a flattened copy padded with a blocked
+        # border, so shifting it by one cell never wraps into another row
+        self.free = ~np.pad(blocked, 1, constant_values=True).ravel()
+        self.dir_x = np.zeros(grid.shape)
+        self.dir_y = np.zeros(grid.shape)
+        self.valid = np.zeros(grid.shape, dtype=bool)
+        self.search = None  # Arrays of the search in progress, if any
+
+    def cell(self, x, y):
+        cx = min(self.width - 1, max(0, int((x - self.world.left) // self.cell_size)))
+        cy = min(self.height - 1, max(0, int((y - self.world.top) // self.cell_size)))
+        return cx, cy
+
+    def update(self, targets):
+        """Recompute the field toward the nearest of targets, a list of (x, y) positions, all at once."""
+        self.start(targets)
+        self.advance(len(self.free))
+
+    def start(self, targets):
+        """Begin searching for the field toward targets. advance() runs the search; the old field stays until it ends."""
+        stride = self.width + 2
+        frontier = np.zeros(len(self.free), dtype=bool)
+        for x, y in targets:
+            cx, cy = self.cell(x, y)
+            frontier[(cy + 1) * stride + cx + 1] = True
+        seeds = frontier.copy()  # A target's own cell counts even when blocked, as survivors can stand in one
+        dist = np.zeros(len(self.free), dtype=np.int32)
+        self.search = [frontier, np.zeros_like(frontier), self.free & ~frontier, dist, seeds]
+
+    @property
+    def searching(self):
+        return self.search is not None
+
+    def advance(self, waves):
+        """Run up to waves steps of the search, replacing the field when it ends. Returns whether it has ended."""
+        # Breadth-first search one whole wavefront at a time: a cell is
+        # reached when a neighbour is in the frontier. Each cell's distance
+        # counts the waves it stayed unvisited through.
+        frontier, reached, unvisited, dist, seeds = self.search
+        stride = self.width + 2
+        for _ in range(waves):
+            inner, around = reached[stride:-stride], frontier
+            np.logical_or(around[stride - 1:-stride - 1], around[stride + 1:-stride + 1], out=inner)
+            np.logical_or(inner, around[:-2 * stride], out=inner)
+            np.logical_or(inner, around[2 * stride:], out=inner)
+            np.logical_and(inner, unvisited[stride:-stride], out=inner)
+            if not inner.any():
+                self.search = None
+                self._point(np.where(unvisited | ~(self.free | seeds), np.inf, dist))
+                return True
+            dist += unvisited
+            unvisited ^= reached
+            frontier, reached = reached, frontier
+        self.search = [frontier, reached, unvisited, dist, seeds]
+        return False
+
+    def _point(self, dist):
+        """Point each cell at its nearest neighbour, if that neighbour is closer to a target."""
+        width, height = self.width, self.height
+        field = dist.reshape(height + 2, width + 2)[1:-1, 1:-1]
+        padded = np.pad(field, 1, constant_values=np.inf)
+        around = np.stack([padded[1 + oy:1 + oy + height, 1 + ox:1 + ox + width] for ox, oy in NEIGHBOURS])
+        best = around.argmin(axis=0)
+        offsets = np.array(NEIGHBOURS, dtype=float)
+        offsets /= np.hypot(offsets[:, 0], offsets[:, 1])[:, None]
+        self.dir_x = offsets[best, 0]
+        self.dir_y = offsets[best, 1]
+        self.valid = around.min(axis=0) < field
+
+    def save(self):
+        """The field and any search in progress, for restore()."""
+        return self.dir_x, self.dir_y, self.valid, self.search and [a.copy() for a in self.search]
+
+    def restore(self, saved):
+        # The field's arrays are replaced, never changed, so only the search is copied
+        self.dir_x, self.dir_y, self.valid, search = saved
+        self.search = search and [a.copy() for a in search]
+
+    def direction(self, x, y):
+        """Unit step toward the nearest target from (x, y), or None if no path is known."""
+        cx, cy = self.cell(x, y)
+        if not self.valid[cy, cx]:
+            return None
+        return float(self.dir_x[cy, cx]), float(self.dir_y[cy, cx])
+
+    def directions(self, x, y):
+        """Unit steps toward the nearest target from arrays of points, and which of them have a path."""
+        cx = np.clip(((x - self.world.left) // self.cell_size).astype(int), 0, self.width - 1)
+        cy = np.clip(((y - self.world.top) // self.cell_size).astype(int), 0, self.height - 1)
+        return self.dir_x[cy, cx], self.dir_y[cy, cx], self.valid[cy, cx]
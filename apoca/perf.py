@@ -0,0 +1,81 @@
+"""Rolling per-frame timings of the game loop, split into its phases.
+
+A frame is timed phase by phase with add(), or by step() itself when a
+match's phase_times is set to the current frame's dict, and closed with
+end_frame(). Only the last history frames are kept. The summary gives the
+mean of every phase, frame time percentiles, a frame time histogram and the
+1% low FPS: the frame rate over the slowest 1% of frames.
+"""
+import csv
+import json
+from collections import deque
+
+import numpy as np
+
+PHASES = ("input", "ai", "movement", "bullets", "infection", "render", "flip")
+HISTORY_FRAMES = 600
+HISTOGRAM_BIN_MS = 2
+HISTOGRAM_BINS = 20  # The last bin also holds every slower frame
+
+
+class FrameStats:
+    """Phase timings and counters of the last history frames."""
+
+    def __init__(self, history=HISTORY_FRAMES):
+        self.frames = deque(maxlen=history)  # (frame seconds, phase seconds, counts) per frame
+        self.phases = dict.fromkeys(PHASES, 0.0)  # The frame being timed
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def end_frame(self, seconds, **counts):
+        """Close the current frame, which took seconds in all, with counters such as live bullets."""
+        self.frames.append((seconds, self.phases.copy(), counts))
+        for phase in self.phases:
+            self.phases[phase] = 0.0
+
+    def frame_times(self):
+        return np.array([frame[0] for frame in self.frames])
+
+    def one_percent_low_fps(self):
+        times = self.frame_times()
+        if not len(times):
+            return 0.0
+        slowest = np.sort(times)[-max(1, len(times) // 100):]
+        return 1 / slowest.mean()
+
+    def histogram(self):
+        """Frames per HISTOGRAM_BIN_MS wide frame time bin."""
+        bins = np.minimum(self.frame_times() * 1000 // HISTOGRAM_BIN_MS, HISTOGRAM_BINS - 1).astype(int)
+        return np.bincount(bins, minlength=HISTOGRAM_BINS)
+
+    def summary(self):
+        times = self.frame_times()
+        if not len(times):
+            return {"frames": 0}
+        return {
+            "frames": len(times),
+            "fps": 1 / times.mean(),
+            "one_percent_low_fps": self.one_percent_low_fps(),
+            "frame_ms": {"mean": times.mean() * 1000, "p50": np.percentile(times, 50) * 1000,
+                         "p99": np.percentile(times, 99) * 1000, "max": times.max() * 1000},
+            "phase_ms": {phase: sum(f[1][phase] for f in self.frames) / len(times) * 1000 for phase in PHASES},
+            "counts": self.frames[-1][2],
+            "histogram_bin_ms": HISTOGRAM_BIN_MS,
+            "histogram": self.histogram().tolist(),
+        }
+
+    def export(self, path):
+        """Write the summary and every kept frame to path, as CSV if it ends in .csv and JSON otherwise."""
+        counters = sorted({name for frame in self.frames for name in frame[2]})
+        rows = [[seconds * 1000] + [phases[p] * 1000 for p in PHASES] + [counts.get(c) for c in counters]
+                for seconds, phases, counts in self.frames]
+        columns = ["frame_ms"] + [f"{p}_ms" for p in PHASES] + counters
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as f:
+                json.dump({"summary": self.summary(), "columns": columns, "frames": rows}, f, indent=1)
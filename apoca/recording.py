@@ -0,0 +1,132 @@
+"""Compact binary input logs, and replaying them through the simulation.
+
+A log starts with a header holding everything needed to rebuild the match
+(map, settings, seed, players), followed by the per-tick inputs of every
+control scheme. Each control scheme's input is packed into one byte, and
+identical consecutive ticks are stored once with a repeat count:
+
+    b"APRC" | version: u8 | header length: u32 | header: JSON
+    then repeated: run length: u16 | one input byte per control scheme
+"""
+import json
+import struct
+import sys
+import time
+
+import pygame
+
+from apoca.bullets import BULLET_CAPACITY, OVERFLOW_GROW
+from apoca.simulation import new_match, step
+from apoca.world import World
+
+MAGIC = b"APRC"
+VERSION = 2
+INPUT_KEYS = ("left", "right", "up", "down", "action", "fire")
+MAX_RUN = 0xFFFF
+
+
+def pack_input(control):
+    bits = 0
+    for bit, key in enumerate(INPUT_KEYS):
+        if control[key]:
+            bits |= 1 << bit
+    return bits
+
+
+def unpack_input(bits):
+    return {key: (bits >> bit) & 1 for bit, key in enumerate(INPUT_KEYS)}
+
+
+def match_header(state, num_humans, ai_survivors, ai_infected, names):
+    """Everything needed to set up state's match again with match_from_header(), as JSON-ready values."""
+    world = state.world
+    return {
+        "width": world.width, "height": world.height,
+        "buildings": [[b.x, b.y, b.width, b.height] for b in world.buildings],
+        "settings": state.config.settings(), "seed": state.seed, "tick_rate": state.tick_rate,
+        "num_humans": num_humans, "ai_survivors": ai_survivors, "ai_infected": ai_infected,
+        "timer_duration": state.timer_duration, "max_ammo": state.max_ammo, "names": list(names),
+        "horde": state.horde, "bullet_capacity": state.config.bullet_capacity,
+        "bullet_overflow": state.config.bullet_overflow,
+    }
+
+
+def match_from_header(header):
+    world = World(header["width"], header["height"], [pygame.Rect(*b) for b in header["buildings"]])
+    return new_match(world, header["settings"], header["num_humans"], header["timer_duration"],
+                     header["max_ammo"], header["ai_survivors"], header["ai_infected"], names=header["names"],
+                     tick_rate=header["tick_rate"], seed=header["seed"], horde=header.get("horde", False),
+                     bullet_capacity=header.get("bullet_capacity", BULLET_CAPACITY),
+                     bullet_overflow=header.get("bullet_overflow", OVERFLOW_GROW))
+
+
+class InputRecorder:
+    """Writes the inputs of one match, tick by tick, to a log file."""
+
+    def __init__(self, path, state, num_humans, ai_survivors, ai_infected, names, num_slots):
+        header = match_header(state, num_humans, ai_survivors, ai_infected, names)
+        header["slots"] = num_slots
+        data = json.dumps(header).encode()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<BI", VERSION, len(data)) + data)
+        self.slots = num_slots
+        self.frame = None
+        self.run = 0
+
+    def record(self, inputs):
+        frame = bytes(pack_input(inputs[i]) for i in range(self.slots))
+        if frame == self.frame and self.run < MAX_RUN:
+            self.run += 1
+            return
+        self._flush()
+        self.frame, self.run = frame, 1
+
+    def _flush(self):
+        if self.run:
+            self.file.write(struct.pack("<H", self.run) + self.frame)
+
+    def close(self):
+        self._flush()
+        self.run = 0
+        self.file.close()
+
+
+def load_recording(path):
+    """Read a log, returning its header and a generator of per-tick inputs."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"{path} is not an Apoca input log")
+    version, length = struct.unpack_from("<BI", data, 4)
+    if version != VERSION:
+        raise ValueError(f"Unsupported input log version {version}")
+    start = 4 + struct.calcsize("<BI")
+    header = json.loads(data[start:start + length])
+
+    def ticks():
+        slots, offset = header["slots"], start + length
+        while offset < len(data):
+            (run,) = struct.unpack_from("<H", data, offset)
+            frame = data[offset + 2:offset + 2 + slots]
+            offset += 2 + slots
+            inputs = [unpack_input(bits) for bits in frame]
+            for _ in range(run):
+                yield inputs
+    return header, ticks()
+
+
+def replay(path):
+    """Re-run a recorded match headless, as fast as possible. Returns the final state."""
+    header, ticks = load_recording(path)
+    state = match_from_header(header)
+    for inputs in ticks:
+        step(state, inputs)
+    return state
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    state = replay(sys.argv[1])
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {state.tick} ticks in {elapsed:.2f}s ({state.tick / state.tick_rate / elapsed:.0f}x real time), "
+          f"winner: {state.winner}")
@@ -0,0 +1,177 @@
+"""Seekable replays: what happened on every tick of a match, stored for viewing rather than re-simulation.
+
+A replay stores a snapshot.Snapshot of every tick: character positions,
+teams, live bullets, time left and winner. Ticks are grouped into blocks
+starting with a full keyframe every KEYFRAME_SECONDS, followed by each
+later tick as a delta against the tick before (see snapshot.pack), so the
+block compresses well as a whole. An index of the blocks at the end of the
+file lets a viewer map the file and decode from the keyframe nearest any
+tick without reading the rest:
+
+    b"APRP" | version: u8 | header length: u32 | header: JSON (recording.match_header)
+    blocks: zlib(repeated snapshot.HEADER | snapshot body)
+    index: keyframe tick: u32, block offset: u64, block length: u32 for every block
+    block count: u32 | index offset: u64 | b"APRX"
+
+Turn an input log into a replay by re-running it, or seek in one:
+
+    python -m apoca.replay recordings/match-20250101-120000-000.aprc
+    python -m apoca.replay recordings/match-20250101-120000-000.aprp --seek 120
+"""
+import bisect
+import json
+import mmap
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from apoca.recording import match_header
+from apoca.snapshot import HEADER, pack, take_snapshot, unpack
+
+MAGIC = b"APRP"
+INDEX_MAGIC = b"APRX"
+VERSION = 2
+KEYFRAME_SECONDS = 2
+INDEX_ENTRY = np.dtype([("tick", "<u4"), ("offset", "<u8"), ("length", "<u4")])
+TRAILER = struct.Struct("<IQ4s")
+
+
+class ReplayWriter:
+    """Writes the snapshot of every tick of one match to a replay file."""
+
+    def __init__(self, path, state, num_humans, ai_survivors, ai_infected, names):
+        data = json.dumps(match_header(state, num_humans, ai_survivors, ai_infected, names)).encode()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<BI", VERSION, len(data)) + data)
+        self.keyframe_ticks = max(1, int(KEYFRAME_SECONDS * state.tick_rate))
+        self.index = []
+        self.block = []
+        self.previous = None
+
+    def record(self, state):
+        """Add state as it is after a tick. Ticks already recorded are skipped."""
+        previous = self.previous
+        if previous and state.tick <= previous.tick:
+            return
+        snapshot = take_snapshot(state, previous)
+        if not self.block or snapshot.tick - self.index[-1][0] >= self.keyframe_ticks:
+            self._flush()
+            self.index.append((snapshot.tick, 0, 0))
+            previous = None
+        self.block.extend(pack(snapshot, previous))
+        self.previous = snapshot
+
+    def _flush(self):
+        if self.block:
+            data = zlib.compress(b"".join(self.block), 9)
+            self.index[-1] = (self.index[-1][0], self.file.tell(), len(data))
+            self.file.write(data)
+            self.block = []
+
+    def close(self):
+        self._flush()
+        offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_ENTRY).tobytes())
+        self.file.write(TRAILER.pack(len(self.index), offset, INDEX_MAGIC))
+        self.file.close()
+
+
+class ReplayReader:
+    """A replay file mapped into memory, decoding only the block around the tick asked for."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+        if data[:4] != MAGIC:
+            raise ValueError(f"{path} is not an Apoca replay")
+        version, length = struct.unpack_from("<BI", data, 4)
+        if version != VERSION:
+            raise ValueError(f"Unsupported replay version {version}")
+        start = 4 + struct.calcsize("<BI")
+        self.header = json.loads(data[start:start + length])
+        count, offset, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} has no replay index (was it closed?)")
+        self.index = np.frombuffer(data, dtype=INDEX_ENTRY, count=count, offset=offset)
+        self.keyframes = self.index["tick"].tolist()
+        self._block = None  # (block number, body, offset of the next snapshot, last snapshot decoded)
+
+    @property
+    def first_tick(self):
+        return self.keyframes[0]
+
+    def snapshot(self, tick):
+        """Snapshot of the last recorded tick at or before tick (or the first one, before it)."""
+        k = max(0, bisect.bisect_right(self.keyframes, tick) - 1)
+        if self._block and self._block[0] == k and self._block[3].tick <= tick:
+            _, body, offset, snapshot = self._block
+        else:
+            entry = self.index[k]
+            body = zlib.decompress(self.data[int(entry["offset"]):int(entry["offset"]) + int(entry["length"])])
+            offset, snapshot = 0, None
+        while offset < len(body):
+            header = HEADER.unpack_from(body, offset)
+            if snapshot and header[1] > tick:
+                break
+            snapshot, offset = unpack(header, body, offset + HEADER.size, snapshot)
+        self._block = (k, body, offset, snapshot)
+        return snapshot
+
+    def last_tick(self):
+        """Tick of the last snapshot, which decodes the last block."""
+        return self.snapshot(0xFFFFFFFF).tick
+
+    def close(self):
+        self._block = None
+        self.index = None
+        self.data.close()
+
+
+def convert(log_path, replay_path):
+    """Re-run an input log (see recording) and write every tick of it to a replay. Returns the final state."""
+    from apoca.recording import load_recording, match_from_header
+    from apoca.simulation import step
+
+    header, ticks = load_recording(log_path)
+    state = match_from_header(header)
+    writer = ReplayWriter(replay_path, state, header["num_humans"], header["ai_survivors"], header["ai_infected"],
+                          header["names"])
+    writer.record(state)
+    for inputs in ticks:
+        step(state, inputs)
+        writer.record(state)
+    writer.close()
+    return state
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Convert an input log to a replay, or seek in a replay.")
+    parser.add_argument("path", help="an .aprc input log to convert, or an .aprp replay")
+    parser.add_argument("--seek", type=float, default=None, help="seconds into the replay to decode")
+    args = parser.parse_args()
+    path = args.path
+    if path.endswith(".aprc"):
+        path = os.path.splitext(path)[0] + ".aprp"
+        start = time.perf_counter()
+        state = convert(args.path, path)
+        print(f"Wrote {path}: {state.tick} ticks in {os.path.getsize(path) / 1024:.0f} KiB "
+              f"({os.path.getsize(path) / max(1, state.tick):.1f} bytes/tick) in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    reader = ReplayReader(path)
+    opened = time.perf_counter() - start
+    tick_rate = reader.header["tick_rate"]
+    target = reader.first_tick + int((args.seek or 0) * tick_rate)
+    start = time.perf_counter()
+    snapshot = reader.snapshot(target)
+    sought = time.perf_counter() - start
+    print(f"Opened in {opened * 1000:.2f} ms: {len(reader.keyframes)} keyframes; seeking to tick {target} took "
+          f"{sought * 1000:.2f} ms: {int((snapshot.flags & 1).sum())} of {len(snapshot.x)} infected, "
+          f"{len(snapshot.bullets)} bullets, {snapshot.time_left:.1f}s left, winner: {snapshot.winner}")
+    print(f"Last tick {reader.last_tick()}")
+    reader.close()
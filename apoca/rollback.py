@@ -0,0 +1,283 @@
+"""Rollback netcode for peer-to-peer matches.
+
+Every peer runs the whole match itself. It steps a tick as soon as its own
+players' input for it is known, predicting the input of remote players it
+has not heard from yet: the last input it has from them, held, without the
+fire press. When a remote input arrives that differs from the prediction a
+tick was run with, the peer restores the state saved at the start of that
+tick (MatchState.save() takes microseconds, so one is kept for every tick)
+and steps forward again to the present within the same frame. A peer that
+gets more than max_rollback ticks ahead of what it has heard from a remote
+peer waits for it rather than predict further.
+
+Peers send each other datagrams of
+
+    player: u8 | tick: i32 | input: u8[] (recording.pack_input)
+
+For one of the sender's players, they carry its inputs from tick on that
+the receiver hasn't acknowledged yet, so lost datagrams are made up for by
+the next one. For one of the receiver's players, they acknowledge its
+inputs up to tick.
+
+Run two peers against each other on localhost with artificial latency, and
+check that they saw the same match:
+
+    python -m apoca.rollback --latency 80 --jitter 20 --loss 0.05
+"""
+import asyncio
+import random
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from apoca.recording import pack_input, unpack_input
+from apoca.simulation import NO_INPUT, step
+
+INPUT_DELAY = 2  # Ticks between reading a local input and running it, to hide some of the latency
+MAX_ROLLBACK = 8
+INPUT_PACKET = struct.Struct("<Bi")
+FIRE_BIT = pack_input(dict(NO_INPUT, fire=1))
+
+
+def checksum(saved):
+    """CRC of a state saved with MatchState.save(), to check that two peers agree."""
+    (entities, bullets, _, _, rng, tick, time_left, winner) = saved
+    crc = zlib.crc32(repr((rng, tick, time_left, winner, bullets[2:])).encode())
+    for column in entities + bullets[:2]:
+        crc = zlib.crc32(column.tobytes(), crc)
+    return crc
+
+
+class RollbackSession:
+    """One peer's view of a peer-to-peer match, run with rollback.
+
+    local_players are the player slots whose input this peer reads; the
+    rest come from remote peers through add_input().
+    """
+
+    def __init__(self, state, num_players, local_players, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK):
+        self.state = state
+        self.num_players = num_players
+        self.local_players = list(local_players)
+        self.remote_players = [p for p in range(num_players) if p not in self.local_players]
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        self.inputs = [{} for _ in range(num_players)]  # Known input of each player by tick
+        self.confirmed = [-1] * num_players  # Last tick up to which each player's input is all known
+        self.used = {}  # Inputs each tick was last run with
+        self.saved = {}  # State at the start of each recent tick
+        self.checksums = {}  # Checksum after each tick whose inputs are all known
+        self.checked = -1
+        self.rollback_to = None
+        self.rollbacks = self.resimulated = self.max_depth = self.stalls = 0
+        self.frame_times = []
+        for player in range(num_players):
+            for tick in range(input_delay):
+                self.add_input(player, tick, 0)
+
+    def add_input(self, player, tick, bits):
+        """Record the input of player for tick, rolling back later if a tick already ran with another."""
+        known = self.inputs[player]
+        if tick <= self.confirmed[player] or tick in known:
+            return
+        known[tick] = bits
+        while self.confirmed[player] + 1 in known:
+            self.confirmed[player] += 1
+        used = self.used.get(tick)
+        if used is not None and used[player] != bits and (self.rollback_to is None or tick < self.rollback_to):
+            self.rollback_to = tick
+
+    def local_inputs(self, player, since):
+        """(first tick, packed inputs) of local player for every tick after since."""
+        known = self.inputs[player]
+        return since + 1, bytes(known[t] for t in range(since + 1, self.confirmed[player] + 1))
+
+    def advance(self, controls):
+        """Run one frame: take the local players' controls, roll back if needed, then step one tick.
+
+        Returns False, without reading controls, if the remote peers are too
+        far behind to step.
+        """
+        start = time.perf_counter()
+        tick = self.state.tick
+        if any(tick - self.confirmed[p] > self.max_rollback for p in self.remote_players):
+            self.stalls += 1
+            return False
+        for player, control in zip(self.local_players, controls):
+            self.add_input(player, tick + self.input_delay, pack_input(control))
+        self.catch_up()
+        self._step(self.state.tick)
+        self.frame_times.append(time.perf_counter() - start)
+        return True
+
+    def catch_up(self):
+        """Roll back to the first tick run with a wrong prediction and step forward to the present again."""
+        target, self.rollback_to = self.rollback_to, None
+        now = self.state.tick
+        if target is not None and target < now:
+            self.state.restore(self.saved[target])
+            for tick in range(target, now):
+                self._step(tick)
+            self.rollbacks += 1
+            self.resimulated += now - target
+            self.max_depth = max(self.max_depth, now - target)
+        self._check()
+
+    def _input(self, player, tick):
+        known = self.inputs[player]
+        if tick in known:
+            return known[tick]
+        return known.get(self.confirmed[player], 0) & ~FIRE_BIT
+
+    def _step(self, tick):
+        bits = [self._input(p, tick) for p in range(self.num_players)]
+        self.used[tick] = bits
+        self.saved[tick] = self.state.save()
+        step(self.state, [unpack_input(b) for b in bits])
+        old = tick - self.max_rollback - 2
+        self.used.pop(old, None)
+        self.saved.pop(old, None)
+        for known in self.inputs:  # Kept longer, to resend to peers that missed them
+            known.pop(old - self.max_rollback * 2, None)
+
+    def _check(self):
+        settled = min(min(self.confirmed), self.state.tick - 1)
+        for tick in range(self.checked + 1, settled + 1):
+            after = self.saved.get(tick + 1)
+            self.checksums[tick] = checksum(after if after else self.state.save())
+        self.checked = max(self.checked, settled)
+
+    def stats(self):
+        times = np.array(self.frame_times or [0]) * 1000
+        return {"ticks": self.state.tick, "rollbacks": self.rollbacks, "resimulated": self.resimulated,
+                "max_depth": self.max_depth, "stalls": self.stalls,
+                "frame_ms": {"mean": times.mean(), "p99": np.percentile(times, 99), "max": times.max()}}
+
+
+# Localhost test harness
+
+class LaggyPeer(asyncio.DatagramProtocol):
+    """A peer on localhost whose outgoing datagrams are delayed, jittered and dropped."""
+
+    def __init__(self, session, latency, jitter, loss, rng):
+        self.session = session
+        self.latency, self.jitter, self.loss = latency, jitter, loss
+        self.rng = rng
+        self.acked = {p: -1 for p in session.local_players}  # Last input of each local player the other peer has
+        self.sent = self.lost = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        player, tick = INPUT_PACKET.unpack_from(data)
+        if player in self.acked:
+            self.acked[player] = max(self.acked[player], tick)
+            return
+        for k, bits in enumerate(data[INPUT_PACKET.size:]):
+            self.session.add_input(player, tick + k, bits)
+
+    def send(self, address):
+        """Send the inputs the other peer lacks, and acknowledge the ones it sent."""
+        session = self.session
+        for player in session.local_players:
+            first, inputs = session.local_inputs(player, self.acked[player])
+            if inputs:
+                self._send(INPUT_PACKET.pack(player, first) + inputs, address)
+        for player in session.remote_players:
+            self._send(INPUT_PACKET.pack(player, session.confirmed[player]), address)
+
+    def _send(self, data, address):
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            self.lost += 1
+            return
+        delay = max(0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        asyncio.get_running_loop().call_later(delay, self.transport.sendto, data, address)
+
+
+async def _play(peer, address, frames, frame_rate, rng):
+    """Press random keys for frames frames, then keep exchanging inputs until both peers agree on every tick."""
+    session, loop = peer.session, asyncio.get_running_loop()
+    keys = dict(NO_INPUT)
+    started = loop.time()
+    frame = 0
+    while session.state.tick < frames:
+        if rng.random() < 0.1:
+            keys = {key: rng.random() < 0.3 for key in NO_INPUT}
+        keys["fire"] = rng.random() < 0.05
+        session.advance([keys])
+        peer.send(address)
+        frame += 1
+        await asyncio.sleep(max(0, started + frame / frame_rate - loop.time()))
+    for _ in range(int(frame_rate * 2)):
+        peer.send(address)
+        session.catch_up()
+        await asyncio.sleep(1 / frame_rate)
+
+
+async def _localhost_match(args):
+    from apoca.config import DEFAULT_SETTINGS
+    from apoca.simulation import new_match
+    from apoca.world import create_world
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    settings = dict(DEFAULT_SETTINGS, ai_difficulty=3)
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    peers = []
+    for slot in range(2):
+        world = create_world(1920, 1080, random.Random(seed))
+        state = new_match(world, settings, 2, args.minutes, -1, args.ai_survivors, args.ai_infected,
+                          tick_rate=args.tick_rate, seed=seed)
+        session = RollbackSession(state, 2, [slot], args.input_delay, args.max_rollback)
+        peer = LaggyPeer(session, args.latency / 2000, args.jitter / 2000, args.loss, random.Random(rng.random()))
+        await loop.create_datagram_endpoint(lambda: peer, local_addr=("127.0.0.1", 0))
+        peers.append(peer)
+    addresses = [peer.transport.get_extra_info("sockname") for peer in peers]
+    frames = int(args.seconds * args.tick_rate)
+    await asyncio.gather(*(_play(peer, addresses[1 - k], frames, args.tick_rate, random.Random(rng.random()))
+                           for k, peer in enumerate(peers)))
+
+    state = peers[0].session.state
+    sample = state.save()
+    start = time.perf_counter()
+    for _ in range(1000):
+        state.save()
+    save_us = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for _ in range(1000):
+        state.restore(sample)
+    restore_us = (time.perf_counter() - start) * 1000
+    print(f"{len(state.entities)} characters; save {save_us:.1f} us, restore {restore_us:.1f} us "
+          f"(frame budget {1e6 / args.tick_rate:.0f} us)")
+    for k, peer in enumerate(peers):
+        s = peer.session.stats()
+        print(f"peer {k + 1}: {s['ticks']} ticks, {s['rollbacks']} rollbacks resimulating {s['resimulated']} ticks "
+              f"(deepest {s['max_depth']}), {s['stalls']} stalled frames, {peer.lost}/{peer.sent} datagrams lost; "
+              f"frame ms mean {s['frame_ms']['mean']:.2f}, p99 {s['frame_ms']['p99']:.2f}, max {s['frame_ms']['max']:.2f}")
+    first, second = (peer.session.checksums for peer in peers)
+    common = first.keys() & second.keys()
+    mismatched = sorted(t for t in common if first[t] != second[t])
+    print(f"{len(common)} ticks compared, {len(mismatched)} desynced" +
+          (f" (first at tick {mismatched[0]})" if mismatched else ""))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play a rollback match between two bot peers on localhost.")
+    parser.add_argument("--latency", type=float, default=80, help="round trip time in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="round trip jitter in ms")
+    parser.add_argument("--loss", type=float, default=0.02, help="fraction of datagrams dropped")
+    parser.add_argument("--input-delay", type=int, default=INPUT_DELAY)
+    parser.add_argument("--max-rollback", type=int, default=MAX_ROLLBACK)
+    parser.add_argument("--ai-survivors", type=int, default=2)
+    parser.add_argument("--ai-infected", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--minutes", type=float, default=1, help="match timer")
+    parser.add_argument("--tick-rate", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=None)
+    asyncio.run(_localhost_match(parser.parse_args()))
@@ -0,0 +1,307 @@
+"""Authoritative match server for remote play, and a client for it, over asyncio.
+
+Players join over TCP: a client sends one JSON line with its name and gets
+back one with its player slot, a token, the server's UDP port and the match
+header (see recording.match_header). Once every human slot is taken the
+server runs the match at its tick rate and, each tick, sends every client a
+snapshot over UDP as a delta against the last one that client acknowledged.
+Clients send their input over UDP whenever they poll it, and again as the
+acknowledgement of each snapshot they receive:
+
+    kind: u8 = INPUT | token: u32 | acknowledged tick: u32 | input: u8 (recording.pack_input)
+
+A fire press is kept until the next tick consumes it, so it is never lost
+between two ticks. When the match ends the server sends the winner over TCP
+and closes the connection.
+
+Run a server with bot clients on localhost, and print its metrics:
+
+    python -m apoca.server --clients 3 --ai-infected 2 --minutes 0.5
+"""
+import asyncio
+import json
+import random
+import secrets
+import struct
+import time
+
+import numpy as np
+
+from apoca.bullets import BULLET_CAPACITY, OVERFLOW_GROW, OVERFLOW_POLICIES
+from apoca.recording import match_from_header, match_header, pack_input, unpack_input
+from apoca.simulation import NO_INPUT, new_match, step
+from apoca.snapshot import FULL, decode, encode, take_snapshot
+
+SERVER_TICK_RATE = 30
+SNAPSHOT_HISTORY = 64  # Ticks of snapshots kept as possible delta baselines
+INPUT = 2
+INPUT_PACKET = struct.Struct("<BIIB")
+FIRE_BIT = pack_input(dict(NO_INPUT, fire=1))
+
+
+class RemotePlayer:
+    """A connected client as the server sees it, with what it has been sent."""
+
+    def __init__(self, slot, name, token, writer):
+        self.slot, self.name, self.token, self.writer = slot, name, token, writer
+        self.address = None  # UDP address, known from its first input
+        self.input = 0
+        self.fired = False
+        self.acked = FULL
+        self.bytes_sent = self.full_snapshots = self.delta_snapshots = 0
+
+
+class GameServer:
+    """Runs one match for num_humans remote players, plus any AI."""
+
+    def __init__(self, world, settings, num_humans, timer_duration, max_ammo, ai_survivors=0, ai_infected=0,
+                 tick_rate=SERVER_TICK_RATE, seed=None, horde=False, bullet_capacity=BULLET_CAPACITY,
+                 bullet_overflow=OVERFLOW_GROW):
+        self.world, self.settings = world, settings
+        self.num_humans, self.ai_survivors, self.ai_infected = num_humans, ai_survivors, ai_infected
+        self.timer_duration, self.max_ammo = timer_duration, max_ammo
+        self.tick_rate, self.seed, self.horde = tick_rate, seed, horde
+        self.bullet_capacity, self.bullet_overflow = bullet_capacity, bullet_overflow
+        self.players = []
+        self.state = None
+        self.snapshots = {}
+        self.tick_times = []
+        self.started = self.finished = None
+        self._full = asyncio.Event()
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Open the TCP and UDP sockets. Returns (host, TCP port) for clients to join."""
+        loop = asyncio.get_running_loop()
+        self.tcp = await asyncio.start_server(self._join, host, port)
+        self.udp, _ = await loop.create_datagram_endpoint(lambda: _ServerProtocol(self), local_addr=(host, 0))
+        return self.tcp.sockets[0].getsockname()[:2]
+
+    async def _join(self, reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+        except (ConnectionError, ValueError):
+            request = None
+        if not isinstance(request, dict):
+            _refuse(writer, "expected a JSON object")
+            return
+        if len(self.players) == self.num_humans:
+            _refuse(writer, "match is full")
+            return
+        player = RemotePlayer(len(self.players), str(request.get("name", ""))[:16], secrets.randbits(32), writer)
+        self.players.append(player)
+        if len(self.players) == self.num_humans:
+            self._full.set()
+        await self._full.wait()
+        if self.state is None:
+            self.state = new_match(self.world, self.settings, self.num_humans, self.timer_duration, self.max_ammo,
+                                   self.ai_survivors, self.ai_infected, names=[p.name or f"P{p.slot + 1}" for p in self.players],
+                                   tick_rate=self.tick_rate, seed=self.seed, horde=self.horde,
+                                   bullet_capacity=self.bullet_capacity, bullet_overflow=self.bullet_overflow)
+        header = match_header(self.state, self.num_humans, self.ai_survivors, self.ai_infected,
+                              self.state.entities.names[:self.num_humans])
+        reply = {"slot": player.slot, "token": player.token, "udp_port": self.udp.get_extra_info("sockname")[1], "header": header}
+        data = json.dumps(reply).encode() + b"\n"
+        player.bytes_sent += len(data)
+        writer.write(data)
+
+    def receive(self, data, address):
+        if len(data) != INPUT_PACKET.size:
+            return
+        kind, token, acked, bits = INPUT_PACKET.unpack(data)
+        player = next((p for p in self.players if p.token == token), None)
+        if kind != INPUT or player is None:
+            return
+        player.address = address
+        if acked != FULL and (player.acked == FULL or acked > player.acked):
+            player.acked = acked
+        player.input = bits
+        player.fired |= bool(bits & FIRE_BIT)
+
+    async def run(self):
+        """Wait for every player, then play the match in real time. Returns the final state."""
+        await self._full.wait()
+        while self.state is None:
+            await asyncio.sleep(0)
+        state, loop = self.state, asyncio.get_running_loop()
+        self.started = loop.time()
+        previous = None
+        while not state.winner:
+            start = time.perf_counter()
+            inputs = []
+            for player in self.players:
+                control = unpack_input(player.input) if player.address else dict(NO_INPUT)
+                control["fire"] = player.fired
+                player.fired = False
+                inputs.append(control)
+            step(state, inputs)
+            previous = self.snapshots[state.tick] = take_snapshot(state, previous)
+            self.snapshots.pop(state.tick - SNAPSHOT_HISTORY, None)
+            self._broadcast(previous)
+            self.tick_times.append(time.perf_counter() - start)
+            await asyncio.sleep(max(0, self.started + state.tick / state.tick_rate - loop.time()))
+        self.finished = loop.time()
+        for player in self.players:
+            player.writer.write(json.dumps({"winner": state.winner}).encode() + b"\n")
+            try:
+                await player.writer.drain()
+            except ConnectionError:
+                pass  # The client left; closing the rest matters more
+            player.writer.close()
+        self.tcp.close()
+        self.udp.close()
+        return state
+
+    def _broadcast(self, snapshot):
+        for player in self.players:
+            if player.address is None:
+                continue
+            baseline = self.snapshots.get(player.acked)
+            data = encode(snapshot, baseline)
+            self.udp.sendto(data, player.address)
+            player.bytes_sent += len(data)
+            if baseline is None:
+                player.full_snapshots += 1
+            else:
+                player.delta_snapshots += 1
+
+    def metrics(self):
+        """Tick times and each client's bandwidth over the match so far."""
+        times = np.array(self.tick_times or [0])
+        elapsed = ((self.finished or asyncio.get_running_loop().time()) - self.started) if self.started else 0
+        return {
+            "ticks": len(self.tick_times),
+            "tick_ms": {"mean": times.mean() * 1000, "p99": np.percentile(times, 99) * 1000, "max": times.max() * 1000},
+            "clients": [{"name": p.name, "bytes": p.bytes_sent, "kbit_per_s": p.bytes_sent * 8 / 1000 / elapsed if elapsed else 0,
+                         "full_snapshots": p.full_snapshots, "delta_snapshots": p.delta_snapshots} for p in self.players],
+        }
+
+
+def _refuse(writer, error):
+    writer.write(json.dumps({"error": error}).encode() + b"\n")
+    writer.close()
+
+
+class _ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address):
+        self.server.receive(data, address)
+
+
+class GameClient:
+    """A remote player: sends its input and keeps the latest snapshot of the match."""
+
+    def __init__(self, name):
+        self.name = name
+        self.snapshots = {}  # Recent snapshots by tick, the baselines deltas refer to
+        self.latest = None
+        self.winner = None
+        self.bytes_received = 0
+        self.input = 0
+
+    async def connect(self, host, port):
+        """Join the server's match, waiting until every player has joined."""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(json.dumps({"name": self.name}).encode() + b"\n")
+        line = await self.reader.readline()
+        self.bytes_received += len(line)
+        reply = json.loads(line)
+        if "error" in reply:
+            raise ConnectionError(reply["error"])
+        self.slot, self.token, self.header = reply["slot"], reply["token"], reply["header"]
+        self.udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _ClientProtocol(self), remote_addr=(host, reply["udp_port"]))
+        self.send(NO_INPUT)
+
+    def send(self, control):
+        """Send this player's input: the control scheme keys held down and "fire" if action was just pressed."""
+        self.input = pack_input(control)
+        self._send()
+
+    def _send(self):
+        acked = self.latest.tick if self.latest else FULL
+        self.udp.sendto(INPUT_PACKET.pack(INPUT, self.token, acked, self.input))
+
+    def receive(self, data):
+        self.bytes_received += len(data)
+        snapshot = decode(data, self.snapshots)
+        if snapshot is None or (self.latest and snapshot.tick <= self.latest.tick):
+            return
+        self.snapshots[snapshot.tick] = self.latest = snapshot
+        # Every older baseline goes, including ones whose successor 64 ticks on was lost
+        for tick in [t for t in self.snapshots if t <= snapshot.tick - SNAPSHOT_HISTORY]:
+            del self.snapshots[tick]
+        self.input &= ~FIRE_BIT  # The server has had the press by now; only the acknowledgement goes on
+        self._send()
+
+    async def wait_for_end(self):
+        """Wait for the match to end and return the winner."""
+        line = await self.reader.readline()
+        self.bytes_received += len(line)
+        self.winner = json.loads(line)["winner"] if line else None
+        self.udp.close()
+        self.writer.close()
+        return self.winner
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, address):
+        self.client.receive(data)
+
+
+async def _bot(client, rng, frame_rate=60):
+    """Press random keys until the match ends."""
+    ending = asyncio.ensure_future(client.wait_for_end())
+    while not ending.done():
+        client.send({"left": rng.random() < 0.3, "right": rng.random() < 0.3, "up": rng.random() < 0.3,
+                     "down": rng.random() < 0.3, "action": rng.random() < 0.1, "fire": rng.random() < 0.05})
+        await asyncio.sleep(1 / frame_rate)
+    return await ending
+
+
+async def _localhost_match(args):
+    from apoca.config import DEFAULT_SETTINGS
+    from apoca.world import create_world
+
+    settings = dict(DEFAULT_SETTINGS, ai_difficulty=3)
+    world = create_world(1920, 1080, random.Random(args.seed))
+    server = GameServer(world, settings, args.clients, args.minutes, -1, args.ai_survivors, args.ai_infected,
+                        tick_rate=args.tick_rate, seed=args.seed, horde=args.horde,
+                        bullet_capacity=args.bullet_capacity, bullet_overflow=args.bullet_overflow)
+    host, port = await server.start()
+    clients = [GameClient(f"Bot {i + 1}") for i in range(args.clients)]
+    running = asyncio.ensure_future(server.run())
+    await asyncio.gather(*(client.connect(host, port) for client in clients))
+    rng = random.Random(args.seed)
+    winners = await asyncio.gather(*(_bot(client, random.Random(rng.random())) for client in clients))
+    state = await running
+
+    metrics = server.metrics()
+    print(f"{metrics['ticks']} ticks at {state.tick_rate} Hz, winner: {state.winner}")
+    print(f"tick ms: mean {metrics['tick_ms']['mean']:.2f}, p99 {metrics['tick_ms']['p99']:.2f}, max {metrics['tick_ms']['max']:.2f}")
+    for client, sent, winner in zip(clients, metrics["clients"], winners):
+        synced = client.latest == server.snapshots.get(client.latest.tick) if client.latest else False
+        print(f"{sent['name']}: {sent['kbit_per_s']:.1f} kbit/s, {sent['bytes']} bytes in {sent['full_snapshots']} full "
+              f"and {sent['delta_snapshots']} delta snapshots; last snapshot matches server: {synced}; saw winner: {winner}")
+    replayed = match_from_header(clients[0].header)  # Clients can rebuild the map and settings from the header
+    print(f"client map: {len(replayed.world.buildings)} buildings, {len(replayed.entities)} characters")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play a match between bot clients and a server on localhost.")
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--ai-survivors", type=int, default=0)
+    parser.add_argument("--ai-infected", type=int, default=0)
+    parser.add_argument("--horde", action="store_true", help="steer the AI infected as a horde")
+    parser.add_argument("--minutes", type=float, default=0.5)
+    parser.add_argument("--tick-rate", type=int, default=SERVER_TICK_RATE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bullet-capacity", type=int, default=BULLET_CAPACITY)
+    parser.add_argument("--bullet-overflow", choices=OVERFLOW_POLICIES, default=OVERFLOW_GROW)
+    asyncio.run(_localhost_match(parser.parse_args()))
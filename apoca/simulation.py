@@ -0,0 +1,406 @@
+"""Rules of a match, free of any window, drawing or frame cap.
+
+A match is a MatchState advanced one tick at a time by step(state, inputs).
+Inputs are one dict per player with the control scheme keys ("left",
+"right", "up", "down", "action") held down this tick, plus "fire" for an
+action key pressed this tick. AI players ignore their input.
+
+Durations are kept in seconds and speeds in pixels per 1/60 s, the units of
+game_settings, and converted to ticks by the match's MatchConfig when it is
+created, so the tick rate can be changed without changing how the game plays.
+"""
+import math
+import random
+import time
+
+import numpy as np
+import pygame
+
+from apoca.bullets import BULLET_CAPACITY, OVERFLOW_GROW, OVERFLOW_POLICIES, BulletStore
+from apoca.config import DEFAULT_SETTINGS, MatchConfig
+from apoca.entities import UNLIMITED_AMMO, Entities
+from apoca.horde import horde_positions, steer_horde
+from apoca.navigation import FLOW_DIRECT_RANGE, FlowField
+from apoca.spatial import SpatialHash
+
+TICK_RATE = 60
+PLAYER_SPREAD = 0.2618
+AI_SPREAD = 0.1
+FLOW_FIELD_INTERVAL = 0.25  # Seconds between flow field updates
+FLOW_WAVES_PER_TICK = 16  # Search steps of a flow field update run each tick
+TARGET_SEARCH_RADIUS = 300  # AI first look for opponents this close, then search the whole map
+NO_INPUT = {"left": 0, "right": 0, "up": 0, "down": 0, "action": 0, "fire": 0}
+
+
+class MatchState:
+    def __init__(self, world, settings, timer_duration, max_ammo, tick_rate=TICK_RATE, seed=None,
+                 bullet_capacity=BULLET_CAPACITY, bullet_overflow=OVERFLOW_GROW):
+        self.world = world
+        self.config = MatchConfig(settings, tick_rate, bullet_capacity, bullet_overflow)
+        self.timer_duration = timer_duration
+        self.max_ammo = max_ammo
+        self.tick_rate = tick_rate
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.rng = random.Random(self.seed)  # Every random choice in the match comes from here
+        self.flow = None  # Shared path toward the survivors for infected AI
+        self.flow_interval_ticks = max(1, int(FLOW_FIELD_INTERVAL * tick_rate))
+        self.horde = False  # AI infected are steered together as a horde
+        self.entities = Entities(0)
+        self.spatial = SpatialHash(world.width, world.height)  # Rebuilt for each batch of entity queries
+        self.bullets = BulletStore(self.config.bullet_capacity, self.config.bullet_overflow)
+        self.attacks = []  # Positions of infected attacks made this tick
+        self.phase_times = None  # When a dict, step() adds the seconds spent in each of its phases to it
+        self.tick = 0
+        self.time_left = timer_duration * 60
+        self.winner = None
+
+    def save(self):
+        """Everything a tick can change, for restore(): characters, bullets, flow field, RNG and clock.
+
+        Takes microseconds, so a rollback can save every tick.
+        """
+        flow = self.flow and self.flow.save()
+        return (self.entities.save(), self.bullets.save(), self.flow, flow, self.rng.getstate(),
+                self.tick, self.time_left, self.winner)
+
+    def restore(self, saved):
+        entities, bullets, self.flow, flow, rng, self.tick, self.time_left, self.winner = saved
+        self.entities.restore(entities)
+        self.bullets.restore(bullets)
+        if flow:
+            self.flow.restore(flow)
+        self.rng.setstate(rng)
+        self.attacks = []
+
+    def player_rect(self, x, y):
+        size = self.config.player_size
+        return pygame.Rect(x - size, y - size, self.config.player_diameter, self.config.player_diameter)
+
+
+def new_match(world, settings, num_humans, timer_duration, max_ammo, ai_survivors=0, ai_infected=0,
+              names=None, tick_rate=TICK_RATE, seed=None, horde=False, bullet_capacity=BULLET_CAPACITY,
+              bullet_overflow=OVERFLOW_GROW):
+    """Set up a match of humans, then AI survivors, then AI infected.
+
+    Without AI infected, one random human or AI survivor starts infected.
+    In horde mode the AI infected are unnamed, start spread around the spawn
+    point farthest from the survivors and are steered by steer_horde().
+    bullet_capacity and bullet_overflow set up its bullet pool.
+    """
+    state = MatchState(world, settings, timer_duration, max_ammo, tick_rate, seed, bullet_capacity, bullet_overflow)
+    state.horde = horde
+    num_players = num_humans + ai_survivors
+    infected_idx = state.rng.randint(0, num_players - 1) if not ai_infected and num_players else None
+    ai_count = ai_survivors + ai_infected
+    ents = state.entities = Entities(num_humans + ai_count)
+    ents.infected[num_players:] = True
+    if infected_idx is not None:
+        ents.infected[infected_idx] = True
+    for i in range(len(ents)):
+        is_ai = i >= num_humans
+        if not is_ai:
+            ents.names[i] = names[i] if names else f"P{i + 1}"
+        else:
+            ents.names[i] = "AI" if ai_count == 1 else f"AI {i - num_humans + 1}"
+        ents.is_ai[i] = is_ai
+        if horde and i >= num_players:
+            ents.names[i] = ""
+        else:
+            ents.x[i], ents.y[i] = spawn_position(state, i)
+    if horde and ai_infected:
+        ents.x[num_players:], ents.y[num_players:] = horde_positions(state, *choose_respawn_point(state, ents.x, ents.y), ai_infected)
+    ents.ammo[:] = max_ammo if max_ammo != -1 else UNLIMITED_AMMO
+    return state
+
+
+def spawn_position(state, i):
+    spawn_points = state.world.spawn_points
+    for k in range(len(spawn_points)):
+        pos = spawn_points[(i + k) % len(spawn_points)]
+        if not state.world.collides(state.player_rect(*pos)):
+            return pos.copy()
+    return spawn_points[i % len(spawn_points)].copy()
+
+
+def choose_respawn_point(state, xs, ys):
+    """Free spawn point farthest from the nearest live survivor, given positions xs and ys."""
+    spawn_points = state.world.spawn_points
+    valid_points = [sp for sp in spawn_points if not state.world.collides(state.player_rect(*sp))]
+    if not valid_points:
+        return spawn_points[0].copy()
+    survivors = np.flatnonzero(state.entities.live_survivors())
+    if not len(survivors):
+        return valid_points[0].copy()
+    points = np.array(valid_points, dtype=float)
+    sx, sy = np.array(xs)[survivors], np.array(ys)[survivors]
+    nearest = ((points[:, 0, None] - sx) ** 2 + (points[:, 1, None] - sy) ** 2).min(axis=1)
+    return valid_points[int(nearest.argmax())].copy()
+
+
+def fire_shotgun(state, i, angle, spread):
+    ents = state.entities
+    x, y = float(ents.x[i]), float(ents.y[i])
+    for offset in [-spread, 0, spread]:
+        state.bullets.spawn(x, y, math.cos(angle + offset), math.sin(angle + offset))
+    ents.shoot_cooldown[i] = state.config.action_cooldown_ticks
+    if ents.ammo[i] != UNLIMITED_AMMO:
+        ents.ammo[i] -= 1
+
+
+def nearest_opponents(state):
+    """Nearest live opponent of every live AI player, found in batched passes.
+
+    Small matches compare every pair at once. In crowded ones, each team's
+    opponents within TARGET_SEARCH_RADIUS come from the spatial hash, and
+    only AI with none that close compare against every opponent. Ties go to
+    the lowest row. Returns a list aligned with the entity rows holding the
+    target's row, or -1 for humans, dead players and AI with no opponent left.
+    """
+    ents = state.entities
+    targets = np.full(len(ents), -1)
+    alive = ents.alive()
+    ai = np.flatnonzero(ents.is_ai & alive)
+    if len(ai) * len(ents) <= state.spatial.brute_force_pairs:
+        if len(ai):
+            dist = (ents.x[ai, None] - ents.x) ** 2 + (ents.y[ai, None] - ents.y) ** 2
+            dist[~((ents.infected[ai, None] != ents.infected) & alive)] = np.inf
+            best = dist.argmin(axis=1)
+            found = dist[np.arange(len(ai)), best] != np.inf
+            targets[ai[found]] = best[found]
+        return targets.tolist()
+
+    for infected in (True, False):
+        seekers = ai[ents.infected[ai] == infected]
+        opponents = np.flatnonzero(alive & (ents.infected != infected))
+        if not len(seekers) or not len(opponents):
+            continue
+        state.spatial.rebuild(ents.x, ents.y, opponents)
+        found = state.spatial.nearest(ents.x[seekers], ents.y[seekers], TARGET_SEARCH_RADIUS)
+        targets[seekers] = found
+        far = seekers[found < 0]
+        if len(far):
+            dist = (ents.x[far, None] - ents.x[opponents]) ** 2 + (ents.y[far, None] - ents.y[opponents]) ** 2
+            targets[far] = opponents[dist.argmin(axis=1)]
+    return targets.tolist()
+
+
+def ai_decision(state, i, target, xs, ys):
+    """Move and act for AI row i; target is its nearest opponent's row from nearest_opponents().
+
+    xs and ys are every player's position this tick, and are updated in place.
+    Returns True if AI infected i attacks this tick.
+    """
+    if target < 0:
+        return
+    ents, config, rng = state.entities, state.config, state.rng
+    infected = ents.infected[i]
+    speed = config.infected_step if infected else config.survivor_step
+    accuracy = config.ai_accuracy
+    x, y = xs[i], ys[i]
+    dx, dy = xs[target] - x, ys[target] - y
+    dist = max(1, math.hypot(dx, dy))
+
+    if infected:
+        path = state.flow.direction(x, y) if state.flow and dist > FLOW_DIRECT_RANGE else None
+        if path:
+            _ai_move(state, i, path[0] * speed, path[1] * speed, speed, xs, ys)
+        else:
+            _ai_move(state, i, dx / dist * speed, dy / dist * speed, speed, xs, ys)
+        return ents.attack_cooldown[i] == 0 and dx * dx + dy * dy < config.attack_radius_sq and rng.random() < accuracy
+
+    else:  # Survivor AI
+        if dist < 200 and ents.shoot_cooldown[i] == 0 and ents.ammo[i] != 0 and rng.random() < accuracy:
+            fire_shotgun(state, i, math.atan2(dy, dx), AI_SPREAD)
+        elif dist < 300:
+            _ai_move(state, i, -dx / dist * speed, -dy / dist * speed, speed, xs, ys)
+
+
+def _ai_move(state, i, dx, dy, speed, xs, ys):
+    """Step AI row i by (dx, dy), sliding along or jittering off walls and the edge of the map in the way."""
+    world, rng = state.world, state.rng
+    x, y = xs[i], ys[i]
+
+    def blocked(px, py):
+        return not (world.left <= px <= world.right and world.top <= py <= world.bottom) or world.collides(state.player_rect(px, py))
+
+    if blocked(x + dx, y + dy):
+        if not blocked(x + dx, y):
+            dy = 0
+        elif not blocked(x, y + dy):
+            dx = 0
+        else:
+            jitter = rng.uniform(-speed * 0.5, speed * 0.5)
+            dx, dy = jitter, jitter if rng.choice([True, False]) else -jitter
+    if world.left <= x + dx <= world.right and world.top <= y + dy <= world.bottom:
+        xs[i], ys[i] = x + dx, y + dy
+    state.entities.last_dx[i], state.entities.last_dy[i] = dx, dy
+
+
+def step(state, inputs):
+    """Advance the match by one tick and return it.
+
+    The state is updated in place; nothing is drawn and no time is waited,
+    so a caller may run ticks as fast as it likes.
+    """
+    if state.winner:
+        return state
+    config, world, ents = state.config, state.world, state.entities
+    size = config.player_size
+    controls = [inputs[i] if i < len(inputs) else NO_INPUT for i in range(len(ents))]
+    state.attacks = []
+    timing = state.phase_times is not None
+    if timing:
+        mark = time.perf_counter()
+        ai_time = 0
+
+    # Shots fired since the last tick
+    can_fire = ~ents.is_ai & ~ents.infected & (ents.shoot_cooldown == 0) & (ents.ammo != 0)
+    for i in np.flatnonzero(can_fire).tolist():
+        if controls[i]["fire"]:
+            fire_shotgun(state, i, math.atan2(ents.last_dy[i], ents.last_dx[i]), PLAYER_SPREAD)
+    if timing:
+        mark = _lap(state, "bullets", mark)
+
+    # Path toward the survivors, shared by all infected AI. Its search is spread over
+    # ticks, while the infected follow the last field (or head straight for a target)
+    if state.tick % state.flow_interval_ticks == 0 and (ents.is_ai & ents.infected).any():
+        if state.flow is None:
+            state.flow = FlowField(world, size)
+        if not state.flow.searching:
+            state.flow.start(ents.positions(ents.live_survivors()))
+    if state.flow and state.flow.searching:
+        state.flow.advance(FLOW_WAVES_PER_TICK)
+
+    # Movement and respawns: the horde in one batch, then everyone else in player order on plain lists
+    targets = nearest_opponents(state)
+    steered = ents.is_ai & ents.infected & state.horde
+    if state.horde:
+        steer_horde(state, targets)
+    if timing:
+        mark = _lap(state, "ai", mark)
+    xs, ys = ents.x.tolist(), ents.y.tolist()
+    timers = ents.respawn_timer.tolist()
+    speeds = np.where(ents.infected, config.infected_step, config.survivor_step).tolist()
+    attacking = set()  # AI infected that attack this tick
+    for i, (is_ai, is_steered) in enumerate(zip(ents.is_ai.tolist(), steered.tolist())):
+        if is_steered:
+            attacking.add(i)  # The horde attacks whenever it can
+        elif is_ai:
+            if timing:
+                started = time.perf_counter()
+                attacks = ai_decision(state, i, targets[i], xs, ys)
+                ai_time += time.perf_counter() - started
+            else:
+                attacks = ai_decision(state, i, targets[i], xs, ys)
+            if attacks:
+                attacking.add(i)
+        else:
+            control = controls[i]
+            speed = speeds[i]
+            dx = (control["right"] - control["left"]) * speed
+            dy = (control["down"] - control["up"]) * speed
+            if dx or dy:
+                ents.last_dx[i], ents.last_dy[i] = dx, dy
+            x, y = xs[i], ys[i]
+            if not world.collides(state.player_rect(x + dx, y)):
+                xs[i] = x + dx
+            if not world.collides(state.player_rect(x, y + dy)):
+                ys[i] = y + dy
+            xs[i] = max(world.left + size, min(world.right - size, xs[i]))
+            ys[i] = max(world.top + size, min(world.bottom - size, ys[i]))
+
+        if timers[i] > 0:
+            timers[i] -= 1
+            ents.respawn_timer[i] = timers[i]
+            if timers[i] == 0:
+                xs[i], ys[i] = choose_respawn_point(state, xs, ys)
+    ents.x[:] = xs
+    ents.y[:] = ys
+    ents.attack_cooldown -= ents.attack_cooldown > 0
+    ents.shoot_cooldown -= ents.shoot_cooldown > 0
+    if timing:
+        mark = _lap(state, "movement", mark + ai_time)
+        state.phase_times["ai"] += ai_time
+
+    # Bullets
+    targets = np.flatnonzero(ents.infected & ents.alive())
+    hit = targets[state.bullets.update(config.bullet_step, world, ents.positions(targets), size)]
+    ents.respawn_timer[hit] = config.respawn_ticks
+    ents.x[hit] = ents.y[hit] = -100
+    if timing:
+        mark = _lap(state, "bullets", mark)
+
+    # Infected attacks, in player order so survivors infected here can attack this tick too
+    attackers = [i for i in np.flatnonzero(ents.attack_cooldown == 0).tolist() if (i in attacking if ents.is_ai[i] else controls[i]["action"])]
+    if attackers and ents.infected[attackers].any():
+        state.spatial.rebuild(ents.x, ents.y, ents.live_survivors())
+        queries, victims = state.spatial.within_radius(ents.x[attackers], ents.y[attackers], config.attack_radius)
+        for k, i in enumerate(attackers):
+            if ents.infected[i]:
+                state.attacks.append((float(ents.x[i]), float(ents.y[i])))
+                ents.infected[victims[queries == k]] = True
+                ents.attack_cooldown[i] = config.action_cooldown_ticks
+
+    # Win conditions
+    state.tick += 1
+    state.time_left = max(0, state.timer_duration * 60 - state.tick / state.tick_rate)
+    if ents.infected.all():
+        state.winner = "infected"
+    elif state.time_left <= 0:
+        state.winner = "survivors"
+    if timing:
+        _lap(state, "infection", mark)
+    return state
+
+
+def _lap(state, phase, mark):
+    """Add the time since mark to phase in state.phase_times and return the current time."""
+    now = time.perf_counter()
+    state.phase_times[phase] = state.phase_times.get(phase, 0) + now - mark
+    return now
+
+
+def run_headless(state, input_source=None, max_ticks=None):
+    """Step a match with no frame cap until it ends or max_ticks pass.
+
+    input_source is called with the state each tick and returns the inputs;
+    without one every human stands still. Returns the number of ticks run.
+    """
+    ticks = 0
+    while not state.winner and (max_ticks is None or ticks < max_ticks):
+        inputs = input_source(state) if input_source else []
+        step(state, inputs)
+        ticks += 1
+    return ticks
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from apoca.world import create_world
+
+    parser = argparse.ArgumentParser(description="Fast-forward a headless match as quickly as the CPU allows.")
+    parser.add_argument("--humans", type=int, default=1)
+    parser.add_argument("--ai-survivors", type=int, default=1)
+    parser.add_argument("--ai-infected", type=int, default=0)
+    parser.add_argument("--horde", action="store_true", help="steer the AI infected as a horde")
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bullet-capacity", type=int, default=BULLET_CAPACITY)
+    parser.add_argument("--bullet-overflow", choices=OVERFLOW_POLICIES, default=OVERFLOW_GROW)
+    args = parser.parse_args()
+
+    settings = dict(DEFAULT_SETTINGS, ai_difficulty=3)
+    world = create_world(1920, 1080, random.Random(args.seed))
+    state = new_match(world, settings, args.humans, args.minutes, -1, args.ai_survivors, args.ai_infected,
+                      tick_rate=args.tick_rate, seed=args.seed, horde=args.horde,
+                      bullet_capacity=args.bullet_capacity, bullet_overflow=args.bullet_overflow)
+    start = time.perf_counter()
+    ticks = run_headless(state)
+    elapsed = time.perf_counter() - start
+    print(f"{ticks} ticks in {elapsed:.2f}s ({ticks / elapsed:.0f} ticks/s, "
+          f"{ticks / state.tick_rate / elapsed:.0f}x real time), winner: {state.winner}")
+    pool = state.bullets.stats()
+    print(f"Bullet pool: peak {pool['peak']} of {pool['capacity']} slots, {pool['spawned']} spawned, "
+          f"grown {pool['grown']} times, {pool['dropped']} dropped")
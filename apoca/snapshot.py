@@ -0,0 +1,149 @@
+"""Quantized match snapshots, sent to network clients as deltas against one they already have.
+
+A snapshot holds what a client draws: every character's position, team and
+whether it is alive, every live bullet, the time left and the winner.
+Positions are rounded to 1/QUANT pixel. A bullet is sent once, as the
+position and direction it had on the first tick a snapshot saw it, and
+clients move it along from there, since bullets fly in straight lines.
+
+A datagram is a fixed header followed by a zlib-compressed body:
+
+    kind: u8 | tick: u32 | baseline tick: u32 | characters: u16 | time left: f32 | winner: u8
+    body: changed-character bitmask | x change: u32[] | y change: u32[] | flags: u8[] of the changed characters
+          | removed bullets: u16 count, serial: u32[]
+          | new bullets: u16 count, serial: u32[], x: u32[], y: u32[], dx: f32[], dy: f32[], tick: u32[]
+
+A baseline tick of FULL means the snapshot is sent whole; otherwise only
+what changed since the baseline snapshot is.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+QUANT = 4  # Positions are sent in 1/QUANT pixels
+POSITION = np.uint32  # Wide enough for the largest maps, and the unused high bytes compress away
+FULL = 0xFFFFFFFF
+SNAPSHOT = 1
+HEADER = struct.Struct("<BIIHfB")
+INFECTED_FLAG, ALIVE_FLAG = 1, 2
+WINNERS = (None, "survivors", "infected")
+BULLET_FIELDS = (("x", POSITION), ("y", POSITION), ("dx", np.float32), ("dy", np.float32), ("tick", np.uint32))
+
+
+class Snapshot:
+    """What clients know of a match at one tick.
+
+    x, y and flags are per-character arrays; bullets maps each live
+    bullet's serial to (x, y, dx, dy, tick): where it was, in 1/QUANT
+    pixels, and its direction on the tick the first snapshot saw it.
+    """
+
+    def __init__(self, tick, x, y, flags, bullets, time_left, winner):
+        self.tick = tick
+        self.x, self.y, self.flags = x, y, flags
+        self.bullets = bullets
+        self.time_left = time_left
+        self.winner = winner
+
+    def __eq__(self, other):
+        return (self.tick == other.tick and np.array_equal(self.x, other.x) and np.array_equal(self.y, other.y)
+                and np.array_equal(self.flags, other.flags) and self.bullets == other.bullets
+                and self.time_left == other.time_left and self.winner == other.winner)
+
+    def bullet_positions(self, step):
+        """(x, y) in pixels of every bullet at this tick, for bullets moving step pixels per tick."""
+        return [(bx / QUANT + dx * step * (self.tick - tick), by / QUANT + dy * step * (self.tick - tick))
+                for bx, by, dx, dy, tick in self.bullets.values()]
+
+
+def quantize(v):
+    return np.clip(np.rint(np.asarray(v) * QUANT), 0, np.iinfo(POSITION).max).astype(POSITION)
+
+
+def take_snapshot(state, previous=None):
+    """Snapshot of state, reusing the bullet records of previous, the snapshot of an earlier tick."""
+    ents, store = state.entities, state.bullets
+    flags = ents.infected.astype(np.uint8) * INFECTED_FLAG | ents.alive().astype(np.uint8) * ALIVE_FLAG
+    known = previous.bullets if previous else {}
+    bullets = {}
+    if len(store):
+        bx, by = quantize(store.x).tolist(), quantize(store.y).tolist()
+        dx, dy = store.dx.astype(np.float32).tolist(), store.dy.astype(np.float32).tolist()
+        for k, serial in enumerate(store.serials.tolist()):
+            bullets[serial] = known.get(serial) or (bx[k], by[k], dx[k], dy[k], state.tick)
+    return Snapshot(state.tick, quantize(ents.x), quantize(ents.y), flags, bullets,
+                    float(np.float32(state.time_left)), state.winner)
+
+
+def pack(snapshot, baseline=None):
+    """Header and uncompressed body of snapshot, as a delta against baseline if one is given."""
+    if baseline is None:
+        changed = np.ones(len(snapshot.x), dtype=bool)
+        old_x = old_y = 0
+        old_bullets = {}
+    else:
+        changed = (snapshot.x != baseline.x) | (snapshot.y != baseline.y) | (snapshot.flags != baseline.flags)
+        old_x, old_y = baseline.x[changed], baseline.y[changed]
+        old_bullets = baseline.bullets
+    removed = np.array([s for s in old_bullets if s not in snapshot.bullets], dtype=np.uint32)
+    spawned = [s for s in snapshot.bullets if s not in old_bullets]
+    records = [snapshot.bullets[s] for s in spawned]
+    # Positions as wrapping differences from the baseline, which are small and compress well
+    parts = [np.packbits(changed).tobytes(), (snapshot.x[changed] - old_x).tobytes(), (snapshot.y[changed] - old_y).tobytes(),
+             snapshot.flags[changed].tobytes(), struct.pack("<H", len(removed)), removed.tobytes(),
+             struct.pack("<H", len(spawned)), np.array(spawned, dtype=np.uint32).tobytes()]
+    for k, (_, dtype) in enumerate(BULLET_FIELDS):
+        parts.append(np.array([r[k] for r in records], dtype=dtype).tobytes())
+    header = HEADER.pack(SNAPSHOT, snapshot.tick, FULL if baseline is None else baseline.tick, len(snapshot.x),
+                         snapshot.time_left, WINNERS.index(snapshot.winner))
+    return header, b"".join(parts)
+
+
+def unpack(header, body, offset=0, baseline=None):
+    """Snapshot from its unpacked header and the body at offset. Returns it and the offset after its body."""
+    _, tick, _, count, time_left, winner = header
+
+    def take(dtype, n):
+        nonlocal offset
+        values = np.frombuffer(body, dtype=dtype, count=n, offset=offset)
+        offset += values.nbytes
+        return values
+
+    changed = np.unpackbits(take(np.uint8, (count + 7) // 8), count=count).astype(bool)
+    n = int(changed.sum())
+    x = baseline.x.copy() if baseline else np.zeros(count, dtype=POSITION)
+    y = baseline.y.copy() if baseline else np.zeros(count, dtype=POSITION)
+    flags = baseline.flags.copy() if baseline else np.zeros(count, dtype=np.uint8)
+    x[changed] += take(POSITION, n)
+    y[changed] += take(POSITION, n)
+    flags[changed] = take(np.uint8, n)
+
+    bullets = dict(baseline.bullets) if baseline else {}
+    for serial in take(np.uint32, int(take(np.uint16, 1)[0])).tolist():
+        del bullets[serial]
+    spawned = take(np.uint32, int(take(np.uint16, 1)[0])).tolist()
+    columns = [take(dtype, len(spawned)).tolist() for _, dtype in BULLET_FIELDS]
+    for serial, record in zip(spawned, zip(*columns)):
+        bullets[serial] = record
+    return Snapshot(tick, x, y, flags, bullets, time_left, WINNERS[winner]), offset
+
+
+def encode(snapshot, baseline=None):
+    """Datagram carrying snapshot, as a delta against baseline if one is given."""
+    header, body = pack(snapshot, baseline)
+    return header + zlib.compress(body)
+
+
+def decode(data, baselines):
+    """Snapshot from a datagram, given the earlier snapshots it may be a delta against by tick.
+
+    Returns None if its baseline is not among them.
+    """
+    header = HEADER.unpack_from(data)
+    baseline = None
+    if header[2] != FULL:
+        baseline = baselines.get(header[2])
+        if baseline is None:
+            return None
+    return unpack(header, zlib.decompress(data[HEADER.size:]), 0, baseline)[0]
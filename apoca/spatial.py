@@ -0,0 +1,136 @@
+"""Spatial indexes for collision queries."""
+import numpy as np
+
+
+class GridIndex:
+    """Uniform grid over static rects, for overlap queries that only look at nearby cells.
+
+    Each rect is bucketed into every cell it covers, so a query walks the
+    cells under the query rect and tests just the rects stored there.
+    """
+
+    def __init__(self, rects, cell_size=128):
+        self.cell_size = cell_size
+        self.rects = list(rects)
+        cells = {}
+        for rect in self.rects:
+            for cell in self._cells(rect):
+                cells.setdefault(cell, []).append(rect)
+        self.cells = cells
+
+    def _cells(self, rect):
+        size = self.cell_size
+        if rect.width <= 0 or rect.height <= 0:
+            return
+        for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+                yield cx, cy
+
+    def collides(self, rect):
+        """True if rect overlaps any indexed rect."""
+        size, cells = self.cell_size, self.cells
+        x0, y0 = rect.left // size, rect.top // size
+        x1, y1 = (rect.right - 1) // size, (rect.bottom - 1) // size
+        if x0 == x1 and y0 == y1:
+            bucket = cells.get((x0, y0))
+            return bucket is not None and rect.collidelist(bucket) != -1
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is not None and rect.collidelist(bucket) != -1:
+                    return True
+        return False
+
+    def query(self, rect):
+        """Indexed rects overlapping rect, in insertion order."""
+        found = set()
+        cells = self.cells
+        for cell in self._cells(rect):
+            for i in rect.collidelistall(cells.get(cell, ())):
+                found.add(id(cells[cell][i]))
+        return [r for r in self.rects if id(r) in found]
+
+
+class SpatialHash:
+    """Uniform grid over moving points, rebuilt from their coordinates whenever they move.
+
+    Points are sorted by cell, so each cell is a slice of one index array and
+    a rebuild is a single sort. Queries are batched: they take arrays of query
+    points and return (query, row) pairs as two aligned arrays. Points and
+    queries outside the grid are bucketed into its edge cells. Batches small
+    enough to compare every point with every query skip the grid entirely.
+    """
+
+    def __init__(self, width, height, cell_size=128, brute_force_pairs=4096):
+        self.cell_size = cell_size
+        self.grid_width = max(1, -(-width // cell_size))
+        self.grid_height = max(1, -(-height // cell_size))
+        self.brute_force_pairs = brute_force_pairs
+        self.rebuild(np.empty(0), np.empty(0), np.empty(0, dtype=int))
+
+    def rebuild(self, x, y, rows):
+        """Index the points (x[rows], y[rows]) under their row numbers; rows may be a mask."""
+        rows = np.asarray(rows)
+        self.indexed = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(int)
+        self.x, self.y = x, y
+        self.order = None  # Sorted by cell on the first query that needs it
+
+    def _sort(self):
+        cells = (self._cell(self.x[self.indexed], self.grid_width) +
+                 self._cell(self.y[self.indexed], self.grid_height) * self.grid_width)
+        self.order = self.indexed[np.argsort(cells, kind="stable")]
+        self.counts = np.bincount(cells, minlength=self.grid_width * self.grid_height)
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    def _cell(self, v, limit):
+        return np.minimum(np.maximum(v // self.cell_size, 0), limit - 1).astype(int)
+
+    def candidates(self, qx, qy, reach):
+        """Pairs of each query point with every indexed point in a cell within reach of it.
+
+        A superset of the points within reach; callers apply the exact test.
+        Pairs come grouped by query.
+        """
+        qx, qy = np.atleast_1d(qx), np.atleast_1d(qy)
+        if len(qx) * len(self.indexed) <= self.brute_force_pairs:
+            return np.repeat(np.arange(len(qx)), len(self.indexed)), (np.zeros((len(qx), 1), dtype=int) + self.indexed).ravel()
+        if self.order is None:
+            self._sort()
+        span = int(2 * reach // self.cell_size) + 2
+        x0, x1 = self._cell(qx - reach, self.grid_width), self._cell(qx + reach, self.grid_width)
+        y0, y1 = self._cell(qy - reach, self.grid_height), self._cell(qy + reach, self.grid_height)
+        steps = np.arange(span)
+        cx = x0[:, None, None] + steps[None, None, :]
+        cy = y0[:, None, None] + steps[None, :, None]
+        inside = (cx <= x1[:, None, None]) & (cy <= y1[:, None, None])
+        cells = (cy * self.grid_width + cx)[inside]
+        queries = np.broadcast_to(np.arange(len(qx))[:, None, None], inside.shape)[inside]
+        counts = self.counts[cells]
+        queries = np.repeat(queries, counts)
+        # Position of each pair in self.order: its cell's start plus its place within the cell
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return queries, self.order[np.repeat(self.starts[cells], counts) + offsets]
+
+    def within_radius(self, qx, qy, radius):
+        """(query, row) pairs of indexed points strictly closer than radius to each query point."""
+        queries, rows = self.candidates(qx, qy, radius)
+        qx, qy = np.atleast_1d(qx), np.atleast_1d(qy)
+        dist = (self.x[rows] - qx[queries]) ** 2 + (self.y[rows] - qy[queries]) ** 2
+        near = dist < radius ** 2
+        return queries[near], rows[near]
+
+    def nearest(self, qx, qy, radius):
+        """Row of the indexed point closest to each query point, or -1 where none is within radius.
+
+        Ties go to the lowest row.
+        """
+        qx, qy = np.atleast_1d(qx), np.atleast_1d(qy)
+        found = np.full(len(qx), -1)
+        queries, rows = self.candidates(qx, qy, radius)
+        dist = (self.x[rows] - qx[queries]) ** 2 + (self.y[rows] - qy[queries]) ** 2
+        near = dist <= radius ** 2
+        queries, rows, dist = queries[near], rows[near], dist[near]
+        order = np.lexsort((rows, dist, queries))
+        first = order[np.unique(queries[order], return_index=True)[1]]
+        found[queries[first]] = rows[first]
+        return found
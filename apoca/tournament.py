@@ -0,0 +1,143 @@
+"""All-AI self-play across a process pool, for sweeping game parameters and checking balance.
+
+Every configuration of the swept parameters plays the same seeds, so the
+configurations are compared on the same maps and spawns. Matches are
+independent and run one per worker process at a time, so throughput grows
+with the number of cores. The report has one CSV row per configuration:
+how often each side won, how long the infected took to infect everyone
+when they did, and how many shots the survivors fired.
+
+    python -m apoca.tournament --set survivor_speed=3,5,7 --set infected_speed=5:9:2 --seeds 50
+    python -m apoca.tournament --set bullet_speed=* --set action_cooldown=* --random 40 --seeds 20
+
+A parameter's values are a list (3,5,7), an inclusive range low:high:step,
+or * for every value the parameters menu offers. Without --random every
+combination is played; with it, that many different ones are drawn at
+random.
+"""
+import csv
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from apoca.config import DEFAULT_SETTINGS, SETTING_LIMITS, check_setting
+
+SWEPT = ("survivor_speed", "infected_speed", "bullet_speed", "action_cooldown", "ai_difficulty")
+PELLETS_PER_SHOT = 3  # fire_shotgun() spawns this many bullets
+COLUMNS = SWEPT + ("matches", "survivor_win_rate", "infected_win_rate", "mean_full_infection_s",
+                   "mean_shots_fired", "mean_match_s")
+
+
+def parse_values(key, spec):
+    """Values of setting key from a list, a low:high:step range or *. Raises ValueError if any is out of limits."""
+    low, high, step = SETTING_LIMITS[key]
+    if ":" in spec:
+        parts = [float(v) for v in spec.split(":")]
+        if len(parts) != 3 or parts[2] <= 0:
+            raise ValueError(f"Range for {key!r} must be low:high:step with a positive step, not {spec!r}")
+        low, high, step = parts
+    if spec == "*" or ":" in spec:
+        values = [round(low + k * step, 6) for k in range(int(round((high - low) / step)) + 1)]
+    else:
+        values = [float(v) for v in spec.split(",")]
+    values = [int(v) if v == int(v) else v for v in values]
+    for value in values:
+        check_setting(key, value)
+    return values
+
+
+def configurations(values, count=None, rng=None):
+    """Every combination of values (a dict of setting to its values), or count different ones drawn with rng."""
+    keys = list(values)
+    if count is None or count >= math.prod(len(v) for v in values.values()):
+        return [dict(zip(keys, combo)) for combo in itertools.product(*(values[k] for k in keys))]
+    drawn = []
+    while len(drawn) < count:
+        combo = tuple(rng.choice(values[k]) for k in keys)
+        if combo not in drawn:
+            drawn.append(combo)
+    return [dict(zip(keys, combo)) for combo in drawn]
+
+
+def play(job):
+    """Play one all-AI match headless. Runs in a worker process."""
+    from apoca.simulation import new_match, run_headless
+    from apoca.world import create_world
+
+    settings, seed, survivors, infected, minutes, tick_rate, horde = job
+    world = create_world(1920, 1080, random.Random(seed))
+    state = new_match(world, settings, 0, minutes, -1, survivors, infected, tick_rate=tick_rate, seed=seed, horde=horde)
+    run_headless(state)
+    return settings, {"winner": state.winner, "seconds": state.tick / tick_rate,
+                      "shots": state.bullets.spawned // PELLETS_PER_SHOT}
+
+
+def summarize(settings, results):
+    infected_wins = [r["seconds"] for r in results if r["winner"] == "infected"]
+    n = len(results)
+    row = [settings[k] for k in SWEPT]
+    row += [n, sum(r["winner"] == "survivors" for r in results) / n, len(infected_wins) / n,
+            sum(infected_wins) / len(infected_wins) if infected_wins else "",
+            sum(r["shots"] for r in results) / n, sum(r["seconds"] for r in results) / n]
+    return row
+
+
+def run_tournament(configs, seeds, survivors, infected, minutes, tick_rate, horde, workers, output):
+    """Play every configuration on every seed across workers processes and write the CSV report to output."""
+    jobs = [(dict(DEFAULT_SETTINGS, **config), seed, survivors, infected, minutes, tick_rate, horde)
+            for config in configs for seed in seeds]
+    results = {}
+    start = time.perf_counter()
+    # Several matches per task keep the pool's messaging small next to the matches themselves
+    chunk = max(1, min(8, len(jobs) // (workers * 4)))
+    with multiprocessing.Pool(workers) as pool:
+        for done, (settings, result) in enumerate(pool.imap_unordered(play, jobs, chunk), 1):
+            results.setdefault(tuple(settings[k] for k in SWEPT), (settings, []))[1].append(result)
+            if done % max(1, len(jobs) // 20) == 0 or done == len(jobs):
+                elapsed = time.perf_counter() - start
+                print(f"{done}/{len(jobs)} matches, {done / elapsed:.1f} matches/s", flush=True)
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(summarize(*results[config]) for config in sorted(results))
+    return time.perf_counter() - start, len(jobs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sweep game parameters over all-AI matches played in parallel.")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUES",
+                        help=f"values of one of {', '.join(SWEPT)}; others keep their defaults")
+    parser.add_argument("--random", type=int, default=None, metavar="N", help="play N random configurations, not the grid")
+    parser.add_argument("--seeds", type=int, default=10, help="matches per configuration")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--survivors", type=int, default=4)
+    parser.add_argument("--infected", type=int, default=4)
+    parser.add_argument("--horde", action="store_true", help="steer the AI infected as a horde")
+    parser.add_argument("--minutes", type=float, default=2, help="match timer")
+    parser.add_argument("--tick-rate", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="tournament.csv")
+    args = parser.parse_args()
+
+    values = {}
+    for spec in args.set:
+        key, _, text = spec.partition("=")
+        if key not in SWEPT:
+            parser.error(f"can only sweep {', '.join(SWEPT)}, not {key!r}")
+        try:
+            values[key] = parse_values(key, text)
+        except ValueError as e:
+            parser.error(str(e))
+    for key in SWEPT:
+        values.setdefault(key, [DEFAULT_SETTINGS[key]])
+    configs = configurations(values, args.random, random.Random(args.first_seed))
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    elapsed, matches = run_tournament(configs, seeds, args.survivors, args.infected, args.minutes, args.tick_rate,
+                                      args.horde, args.workers, args.output)
+    print(f"{matches} matches of {len(configs)} configurations in {elapsed:.1f}s on {args.workers} workers "
+          f"({matches / elapsed / args.workers:.2f} matches/s per worker); report in {args.output}")
@@ -0,0 +1,202 @@
+import math
+import random
+
+import numpy as np
+import pygame
+
+from apoca.spatial import GridIndex
+
+BORDER_WIDTH = 50
+GRID_CELL = 10
+BASE_MAP_AREA = 1920 * 1080  # Maps up to this size get the base number of buildings
+
+
+class World:
+    """Static map of a match: playable bounds, spawn points and buildings."""
+
+    def __init__(self, width, height, buildings=None, border=BORDER_WIDTH):
+        self.width, self.height = width, height
+        self.left, self.right = border, width - border
+        self.top, self.bottom = border, height - border
+        self.spawn_points = make_spawn_points(self.left, self.top, self.right, self.bottom)
+        self.set_buildings(buildings if buildings is not None else [])
+
+    def set_buildings(self, buildings, grid=None):
+        self.buildings = buildings
+        self.grid = grid if grid is not None else build_grid(self, buildings)  # Navigation grid, 1 = blocked
+        self.index = GridIndex(buildings)
+        self.building_bounds = np.array([(b.left, b.top, b.right, b.bottom) for b in buildings], dtype=float).reshape(-1, 4)
+
+    def collides(self, rect):
+        return self.index.collides(rect)
+
+    def squares_collide(self, x, y, half_size):
+        """Which squares of half_size around the points (x, y) overlap a building.
+
+        Squares are truncated to whole pixels like pygame.Rect, so each answer
+        matches collides() on the same square.
+        """
+        left = np.trunc(x - half_size)[:, None]
+        top = np.trunc(y - half_size)[:, None]
+        size = int(half_size * 2)
+        walls = self.building_bounds
+        return ((left < walls[:, 2]) & (walls[:, 0] < left + size) &
+                (top < walls[:, 3]) & (walls[:, 1] < top + size)).any(axis=1)
+
+
+def make_spawn_points(left, top, right, bottom):
+    center_x, center_y = (left + right) // 2, (top + bottom) // 2
+    return [
+        [left + 50, top + 50], [right - 50, top + 50],
+        [left + 50, bottom - 50], [right - 50, bottom - 50],
+        [center_x, top + 50], [center_x, bottom - 50],
+        [left + 50, center_y], [right - 50, center_y],
+    ]
+
+
+# Building Generation
+def is_point_in_safe_zone(x, y, spawn_points, safe_radius=100):
+    for sp in spawn_points:
+        if math.sqrt((x - sp[0])**2 + (y - sp[1])**2) < safe_radius:
+            return True
+    return False
+
+
+class OccupancyGrid:
+    """Array-backed count of buildings over each grid cell, with labelled free regions.
+
+    Cells hold how many buildings cover them, so removing a building only
+    decrements its cells. Free cells are kept as runs per row; removing a
+    building re-scans just the rows it covered before the regions are
+    relabelled by joining runs that touch between neighbouring rows.
+    """
+
+    def __init__(self, world, buildings):
+        self.left, self.top = world.left, world.top
+        self.width = max(0, (world.right - world.left) // GRID_CELL)
+        self.height = max(0, (world.bottom - world.top) // GRID_CELL)
+        self.counts = np.zeros((self.height, self.width), dtype=np.uint16)
+        for b in buildings:
+            self.counts[self._cells(b)] += 1
+        self.runs = [self._row_runs(y) for y in range(self.height)]
+        self._labels = None
+
+    def _cells(self, b):
+        x0 = min(self.width, max(0, (b.x - self.left) // GRID_CELL))
+        x1 = min(self.width, max(0, (b.x + b.width - self.left) // GRID_CELL))
+        y0 = min(self.height, max(0, (b.y - self.top) // GRID_CELL))
+        y1 = min(self.height, max(0, (b.y + b.height - self.top) // GRID_CELL))
+        return slice(y0, y1), slice(x0, x1)
+
+    def _row_runs(self, y):
+        free = np.concatenate(([0], self.counts[y] == 0, [0])).astype(np.int8)
+        edges = np.flatnonzero(np.diff(free))
+        return edges[0::2].tolist(), edges[1::2].tolist()
+
+    def remove(self, building):
+        rows, cols = self._cells(building)
+        self.counts[rows, cols] -= 1
+        for y in range(rows.start, rows.stop):
+            self.runs[y] = self._row_runs(y)
+        self._labels = None
+
+    def blocked(self):
+        return (self.counts > 0).astype(np.uint8)
+
+    def labels(self):
+        """Component label of every cell, 0 for blocked cells, joined through the four side neighbours."""
+        if self._labels is not None:
+            return self._labels
+        parent = []
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        first = []  # Id of the first run in each row
+        prev_starts, prev_ends, prev_first = [], [], 0
+        for starts, ends in self.runs:
+            row_first = len(parent)
+            first.append(row_first)
+            parent.extend(range(row_first, row_first + len(starts)))
+            i = j = 0
+            while i < len(prev_starts) and j < len(starts):
+                if prev_starts[i] < ends[j] and starts[j] < prev_ends[i]:
+                    a, b = find(prev_first + i), find(row_first + j)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+                if prev_ends[i] < ends[j]:
+                    i += 1
+                else:
+                    j += 1
+            prev_starts, prev_ends, prev_first = starts, ends, row_first
+
+        labels = np.zeros((self.height, self.width), dtype=np.int32)
+        for y, (starts, ends) in enumerate(self.runs):
+            for k, (start, end) in enumerate(zip(starts, ends)):
+                labels[y, start:end] = find(first[y] + k) + 1
+        self._labels = labels
+        return labels
+
+    def disconnected(self, cells, anchor):
+        """For each (x, y) cell, whether it lies outside the free region containing anchor."""
+        labels = self.labels()
+        target = labels[anchor[1], anchor[0]]
+        xs, ys = np.array(cells).T
+        return ((labels[ys, xs] != target) | (target == 0)).tolist()
+
+
+def build_grid(world, buildings):
+    return OccupancyGrid(world, buildings).blocked()
+
+
+def generate_buildings(world, rng=random):
+    """Place random buildings, keeping every spawn point connected to the centre.
+
+    Returns the buildings and their navigation grid.
+    """
+    left, top, right, bottom = world.left, world.top, world.right, world.bottom
+    spawn_points = world.spawn_points
+    buildings = []
+    safe_radius = 100
+    density = max(1, (world.width * world.height) // BASE_MAP_AREA)
+    for _ in range(8 * density):
+        while True:
+            x = rng.randint(left + 50, right - 50)
+            y = rng.randint(top + 50, bottom - 50)
+            width = rng.randint(100, 300)
+            height = rng.randint(100, 300)
+            new_wall = pygame.Rect(x, y, width, height)
+            if not is_point_in_safe_zone(x, y, spawn_points, safe_radius):
+                buildings.append(new_wall)
+                break
+    for _ in range(15 * density):
+        while True:
+            x = rng.randint(left + 50, right - 50)
+            y = rng.randint(top + 50, bottom - 50)
+            width = rng.randint(50, 150)
+            height = rng.randint(50, 150)
+            new_wall = pygame.Rect(x, y, width, height)
+            if not is_point_in_safe_zone(x, y, spawn_points, safe_radius) and len(new_wall.collidelistall(buildings)) < 2:
+                buildings.append(new_wall)
+                break
+    occupancy = OccupancyGrid(world, buildings)
+    center = (occupancy.width // 2, occupancy.height // 2)
+    cells = [((sp[0] - left) // GRID_CELL, (sp[1] - top) // GRID_CELL) for sp in spawn_points]
+    unreachable = occupancy.disconnected(cells, center)
+    for k, sp in enumerate(spawn_points):
+        if unreachable[k]:
+            for i, building in enumerate(buildings):
+                if pygame.Rect(sp[0] - 50, sp[1] - 50, 100, 100).colliderect(building):
+                    occupancy.remove(buildings.pop(i))
+                    unreachable = occupancy.disconnected(cells, center)
+                    break
+    return buildings, occupancy.blocked()
+
+
+def create_world(width, height, rng=random):
+    world = World(width, height)
+    world.set_buildings(*generate_buildings(world, rng))
+    return world
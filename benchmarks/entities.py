@@ -0,0 +1,68 @@
+"""Per-tick simulation cost and memory per character against player count.
+
+    python benchmarks/entities.py
+
+Half the AI are survivors and half infected, alongside two humans pressing
+random keys. Memory is the deep size of the match's character store divided
+by the number of characters. Each size is run REPEATS times from the same
+seed and the fastest run is kept.
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apoca.config import DEFAULT_SETTINGS
+from apoca.simulation import new_match, step
+from apoca.world import create_world
+
+SETTINGS = dict(DEFAULT_SETTINGS, ai_difficulty=3)
+AI_COUNTS = [2, 10, 50, 100, 200, 500, 1000]
+HUMANS = 2
+TICKS = 600
+REPEATS = 3
+KEYS = ("left", "right", "up", "down", "action", "fire")
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by obj and everything it refers to, each object counted once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (0 if obj.flags.owndata else obj.nbytes)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def main():
+    world = create_world(1920, 1080, random.Random(0))
+    print(f"{'players':>7} {'us/tick':>8} {'ticks/s':>8} {'bytes/player':>13}")
+    for ai in AI_COUNTS:
+        rng = random.Random(0)
+        inputs = [[{key: rng.random() < 0.3 for key in KEYS} for _ in range(HUMANS)] for _ in range(TICKS)]
+        elapsed = float("inf")
+        for _ in range(REPEATS):
+            state = new_match(world, SETTINGS, HUMANS, 60, -1, ai // 2, ai - ai // 2, seed=0)
+            start = time.perf_counter()
+            for tick_inputs in inputs:
+                step(state, tick_inputs)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        count = HUMANS + ai
+        per_player = deep_size(state.entities) / count
+        print(f"{count:>7} {elapsed / TICKS * 1e6:>8.0f} {TICKS / elapsed:>8.0f} {per_player:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Horde mode cost against horde size, next to the 60 FPS frame budget.
+
+    python benchmarks/horde.py
+
+Each size plays horde matches against four AI survivors for TICKS ticks,
+starting a new match whenever one ends. A frame is one simulation tick plus
+drawing every agent onto a 1920x1080 surface, which is what the game does
+per frame at 60 FPS. A size holds 60 FPS if its 99th percentile frame fits
+in the budget, so occasional slow ticks count against it, not just the mean.
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pygame
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apoca.config import DEFAULT_SETTINGS
+from apoca.horde import HORDE_TARGET_AGENTS
+from apoca.simulation import new_match, step
+from apoca.world import create_world
+
+SETTINGS = dict(DEFAULT_SETTINGS, ai_difficulty=3)
+HORDE_SIZES = [100, 200, HORDE_TARGET_AGENTS, 500, 1000]
+TICKS = 600
+FRAME_BUDGET_MS = 1000 / 60
+
+
+def main():
+    world = create_world(1920, 1080, random.Random(0))
+    surface = pygame.Surface((world.width, world.height))
+    print(f"target: {HORDE_TARGET_AGENTS} agents")
+    print(f"{'agents':>6} {'tick ms':>8} {'draw ms':>8} {'frame ms':>9} {'p99 ms':>7} {'worst ms':>9} {'60 FPS':>7}")
+    for size in HORDE_SIZES:
+        ticks, draws = [], []
+        seed = 0
+        state = new_match(world, SETTINGS, 0, 60, -1, 4, size, seed=seed, horde=True)
+        while len(ticks) < TICKS:
+            if state.winner:
+                seed += 1
+                state = new_match(world, SETTINGS, 0, 60, -1, 4, size, seed=seed, horde=True)
+            start = time.perf_counter()
+            step(state, [])
+            ticks.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ents = state.entities
+            for x, y in zip(ents.x.tolist(), ents.y.tolist()):
+                pygame.draw.circle(surface, (0, 255, 0), (int(x), int(y)), SETTINGS["player_size"])
+            draws.append(time.perf_counter() - start)
+        ticks, draws = np.array(ticks) * 1000, np.array(draws) * 1000
+        frames = ticks + draws
+        p99 = np.percentile(frames, 99)
+        print(f"{size:>6} {ticks.mean():>8.2f} {draws.mean():>8.2f} {frames.mean():>9.2f} {p99:>7.2f} {frames.max():>9.2f} "
+              f"{'yes' if p99 <= FRAME_BUDGET_MS else 'no':>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Map generation time against map size.
+
+    python benchmarks/mapgen.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apoca.world import create_world
+
+SIZES = [(1280, 720), (1920, 1080), (2560, 1440), (3840, 2160), (7680, 4320)]
+SEEDS = 10
+
+
+def main():
+    print(f"{'map size':>12} {'grid cells':>11} {'mean ms':>8} {'max ms':>8}")
+    for width, height in SIZES:
+        times = []
+        for seed in range(SEEDS):
+            start = time.perf_counter()
+            world = create_world(width, height, random.Random(seed))
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{width:>5}x{height:<6} {world.grid.size:>11} {sum(times) / len(times):>8.1f} {max(times):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
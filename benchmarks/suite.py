@@ -0,0 +1,203 @@
+"""Scripted performance scenarios, compared against a stored JSON baseline.
+
+    python benchmarks/suite.py                  # run, and compare with the baseline if there is one
+    python benchmarks/suite.py --save-baseline  # run and store the results as the new baseline
+    python benchmarks/suite.py --only firing ai_only
+
+Runs headless under the dummy SDL video driver. Every scenario is run
+REPEATS times from the same seeds and the fastest run is kept. Each result
+reports its rate (ticks, frames or maps per second) and the mean, 99th
+percentile and worst time of a single tick or frame. A result whose mean
+time is more than --threshold slower than the baseline is flagged as a
+regression and the suite exits with status 1. Baselines are only meaningful
+on the machine that recorded them.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pygame
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apoca.config import DEFAULT_SETTINGS
+from apoca.simulation import new_match, step
+from apoca.world import World, create_world, generate_buildings
+
+SETTINGS = dict(DEFAULT_SETTINGS, ai_difficulty=3)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+REGRESSION_THRESHOLD = 0.15
+REPEATS = 3
+TICKS = 600
+SCREEN_SIZE = (1920, 1080)
+FIRING_PLAYERS = 20
+AI_SURVIVORS = AI_INFECTED = 10
+LAYOUT_SEEDS = 50  # Layouts searched for the worst case
+MENU_FRAMES = 300
+MAP_SIZES = [(1280, 720), (1920, 1080), (3840, 2160)]
+MAP_SEEDS = 10
+
+
+def firing():
+    """FIRING_PLAYERS humans with unlimited ammo running about and firing every tick."""
+    world = create_world(*SCREEN_SIZE, random.Random(0))
+    state = new_match(world, SETTINGS, FIRING_PLAYERS, 60, -1, seed=0)
+    rng = random.Random(0)
+    times = []
+    for _ in range(TICKS):
+        inputs = [{"left": rng.random() < 0.3, "right": rng.random() < 0.3, "up": rng.random() < 0.3,
+                   "down": rng.random() < 0.3, "action": False, "fire": True} for _ in range(FIRING_PLAYERS)]
+        start = time.perf_counter()
+        step(state, inputs)
+        times.append(time.perf_counter() - start)
+    return {"firing": times}
+
+
+def ai_only():
+    """AI survivors against AI infected, starting a new match whenever one ends."""
+    world = create_world(*SCREEN_SIZE, random.Random(0))
+    seed = 0
+    state = new_match(world, SETTINGS, 0, 60, -1, AI_SURVIVORS, AI_INFECTED, seed=seed)
+    times = []
+    while len(times) < TICKS:
+        if state.winner:
+            seed += 1
+            state = new_match(world, SETTINGS, 0, 60, -1, AI_SURVIVORS, AI_INFECTED, seed=seed)
+        start = time.perf_counter()
+        step(state, [])
+        times.append(time.perf_counter() - start)
+    return {"ai_only": times}
+
+
+def worst_layout_seed():
+    """Seed of the generate_buildings layout that removes the most buildings to keep the map connected.
+
+    Each removal runs another connectivity check, which makes it the slowest
+    layout to generate, and ties go to the layout with the most blocked cells.
+    """
+    def cost(seed):
+        world = create_world(*SCREEN_SIZE, random.Random(seed))
+        return -len(world.buildings), int(world.grid.sum())  # Every building is placed, so fewer were kept
+    return max(range(LAYOUT_SEEDS), key=cost)
+
+
+def worst_layout():
+    """Generating the worst-case layout, then AI playing on it."""
+    seed = worst_layout_seed()
+    generate = []
+    for _ in range(MAP_SEEDS):
+        world = World(*SCREEN_SIZE)
+        start = time.perf_counter()
+        world.set_buildings(*generate_buildings(world, random.Random(seed)))
+        generate.append(time.perf_counter() - start)
+    state = new_match(world, SETTINGS, 0, 60, -1, AI_SURVIVORS, AI_INFECTED, seed=seed)
+    ticks = []
+    while len(ticks) < TICKS and not state.winner:
+        start = time.perf_counter()
+        step(state, [])
+        ticks.append(time.perf_counter() - start)
+    return {"worst_layout_generate": generate, "worst_layout_match": ticks}
+
+
+def menu():
+    """Main menu background frames: draw_gradient_background and a display flip."""
+    import GrokApoc
+
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    GrokApoc.gradient_cache.clear()
+    times = []
+    for _ in range(MENU_FRAMES):
+        start = time.perf_counter()
+        GrokApoc.draw_gradient_background(screen, GrokApoc.RED, GrokApoc.PURPLE)
+        pygame.display.flip()
+        times.append(time.perf_counter() - start)
+    return {"menu": times}
+
+
+def mapgen():
+    """create_world at each of MAP_SIZES."""
+    results = {}
+    for width, height in MAP_SIZES:
+        times = []
+        for seed in range(MAP_SEEDS):
+            start = time.perf_counter()
+            create_world(width, height, random.Random(seed))
+            times.append(time.perf_counter() - start)
+        results[f"mapgen_{width}x{height}"] = times
+    return results
+
+
+SCENARIOS = {"firing": firing, "ai_only": ai_only, "worst_layout": worst_layout, "menu": menu, "mapgen": mapgen}
+
+
+def summarize(times):
+    times = np.array(times)
+    return {"rate": len(times) / times.sum(), "mean_ms": times.mean() * 1000,
+            "p99_ms": np.percentile(times, 99) * 1000, "max_ms": times.max() * 1000}
+
+
+def run(names):
+    """Summaries of every result of the named scenarios, keeping each result's fastest run."""
+    results = {}
+    for name in names:
+        for _ in range(REPEATS):
+            for result, times in SCENARIOS[name]().items():
+                summary = summarize(times)
+                if result not in results or summary["mean_ms"] < results[result]["mean_ms"]:
+                    results[result] = summary
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark scenarios and check them against a baseline.")
+    parser.add_argument("--only", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown of the mean time, as a fraction, flagged as a regression")
+    parser.add_argument("--output", help="also write these results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.only)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'result':<24} {'rate/s':>9} {'mean ms':>8} {'p99 ms':>8} {'max ms':>8} {'vs base':>8}")
+    for result, summary in results.items():
+        change = ""
+        if result in baseline:
+            ratio = summary["mean_ms"] / baseline[result]["mean_ms"] - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append(result)
+                change += " !"
+        print(f"{result:<24} {summary['rate']:>9.0f} {summary['mean_ms']:>8.3f} {summary['p99_ms']:>8.3f} "
+              f"{summary['max_ms']:>8.3f} {change:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                results = {**json.load(f), **results}  # Keep the baseline of scenarios not run this time
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import math
+import random
+
+import numpy as np
+
+from apoca.bullets import BulletStore, segment_entry
+from apoca.world import create_world
+
+HALF_SIZE = 20
+
+
+def shoot(world, speed, substeps, bullets, targets):
+    """Fly bullets for 2 * speed pixels in substeps equal steps, removing targets as they are hit.
+
+    Returns the targets hit and the serials and positions of the bullets left.
+    """
+    store = BulletStore()
+    for x, y, angle in bullets:
+        store.spawn(x, y, math.cos(angle), math.sin(angle))
+    left = list(range(len(targets)))
+    hit = set()
+    for _ in range(substeps):
+        found = store.update(2 * speed / substeps, world, [targets[t] for t in left], HALF_SIZE)
+        hit.update(left[k] for k in found)
+        left = [t for k, t in enumerate(left) if k not in found]
+    order = np.argsort(store.serials)
+    return hit, store.serials[order].tolist(), store.x[order], store.y[order]
+
+
+def test_hits_do_not_depend_on_step_size():
+    rng = random.Random(0)
+    for layout in range(300):
+        if layout % 30 == 0:
+            world = create_world(1920, 1080, rng)
+        speed = rng.uniform(5, 90)  # Up to 180 px in the single step
+        bullets = [(rng.uniform(world.left, world.right), rng.uniform(world.top, world.bottom),
+                    rng.uniform(-math.pi, math.pi)) for _ in range(rng.randint(1, 40))]
+        targets = [(rng.uniform(world.left, world.right), rng.uniform(world.top, world.bottom))
+                   for _ in range(rng.randint(0, 30))]
+        hit, serials, x, y = shoot(world, speed, 1, bullets, targets)
+        for substeps in (2, 4):
+            hit_n, serials_n, x_n, y_n = shoot(world, speed, substeps, bullets, targets)
+            assert hit_n == hit
+            assert serials_n == serials
+            assert np.allclose(x_n, x) and np.allclose(y_n, y)
+
+
+def entry(x, y, dx, dy, rect=(10, 10, 20, 20)):
+    return float(segment_entry(np.array(x, dtype=float), np.array(y, dtype=float), np.array(dx, dtype=float),
+                               np.array(dy, dtype=float), *rect))
+
+
+def test_segment_entry_edge_cases():
+    assert entry(0, 15, 20, 0) == 0.5  # Enters partway along
+    assert entry(0, 15, 5, 0) == math.inf  # Stops short
+    assert entry(15, 15, 0, 0) == 0  # Zero-length step inside
+    assert entry(5, 15, 0, 0) == math.inf  # Zero-length step outside
+    assert entry(15, 15, 30, 30) == 0  # Starts inside
+    assert entry(0, 10, 30, 0) == math.inf  # Slides along the top edge
+    assert entry(0, 15, 10, 0) == math.inf  # Ends on the left edge
+    assert entry(20, 15, 10, 0) == math.inf  # Starts on the right edge, moving away
+    assert entry(20, 15, -10, 0) == 0  # Starts on the right edge, moving in
+    assert entry(0, 0, 20, 20) == 0.5  # Through the top left corner diagonally
+    assert entry(0, 20, 20, -20) == math.inf  # Only touches the top left corner
+    assert segment_entry(np.zeros(3), np.full(3, 15.0), np.array([20.0, 5, 0]), np.zeros(3),
+                         10, 10, 20, 20).tolist() == [0.5, math.inf, math.inf]
@@ -0,0 +1,104 @@
+import random
+
+from apoca.config import DEFAULT_SETTINGS
+from apoca.replay import ReplayReader, ReplayWriter
+from apoca.simulation import NO_INPUT, new_match, step
+from apoca.snapshot import QUANT, decode, encode, take_snapshot
+from apoca.world import create_world
+
+
+def play(world, ticks, setup=None):
+    """Snapshots of every tick of a seeded match with one human who fires now and then."""
+    state = new_match(world, dict(DEFAULT_SETTINGS), 1, 1, -1, 2, 2, seed=0)
+    if setup:
+        setup(state)
+    rng = random.Random(0)
+    snapshots = [take_snapshot(state)]
+    for _ in range(ticks):
+        step(state, [dict(NO_INPUT, fire=rng.random() < 0.1)])
+        snapshots.append(take_snapshot(state, snapshots[-1]))
+    return state, snapshots
+
+
+def record(path, world, ticks, setup=None):
+    """Write a replay of a match like play()'s and return the snapshots it recorded, by tick."""
+    state = new_match(world, dict(DEFAULT_SETTINGS), 1, 1, -1, 2, 2, seed=0)
+    if setup:
+        setup(state)
+    writer = ReplayWriter(path, state, 1, 2, 2, ["P1"])
+    rng = random.Random(0)
+    recorded = {}
+    writer.record(state)
+    recorded[state.tick] = writer.previous
+    for _ in range(ticks):
+        step(state, [dict(NO_INPUT, fire=rng.random() < 0.1)])
+        writer.record(state)
+        recorded[state.tick] = writer.previous
+    writer.close()
+    return recorded
+
+
+FAR = None  # Free spot past 16383 px, the most a 16-bit quarter-pixel position could hold
+
+
+def far_corner(state):
+    """Put the human at FAR, facing back across the map so its shots fly a while."""
+    global FAR
+    if FAR is None:
+        FAR = next((x + 0.25, y + 0.75) for x in range(20000, 16500, -100) for y in range(1000, 11000, 100)
+                   if not any(state.world.collides(state.player_rect(x - d, y)) for d in (0, 100, 200)))
+    ents = state.entities
+    ents.x[0], ents.y[0] = FAR
+    ents.last_dx[0], ents.last_dy[0] = -1, 0
+
+
+def test_snapshots_round_trip_full_and_delta():
+    _, snapshots = play(create_world(1920, 1080, random.Random(0)), 300)
+    assert any(s.bullets for s in snapshots)
+    for k, snapshot in enumerate(snapshots):
+        assert decode(encode(snapshot), {}) == snapshot
+        for baseline in snapshots[max(0, k - 10):k]:
+            assert decode(encode(snapshot, baseline), {baseline.tick: baseline}) == snapshot
+    assert decode(encode(snapshots[-1], snapshots[-2]), {}) is None
+
+
+def test_replay_seeks_within_and_across_blocks(tmp_path):
+    path = str(tmp_path / "match.aprp")
+    recorded = record(path, create_world(1920, 1080, random.Random(0)), 600)
+    reader = ReplayReader(path)
+    try:
+        assert len(reader.keyframes) > 3
+        first, last = reader.first_tick, max(recorded)
+        assert reader.last_tick() == last
+        forward = list(range(first, last + 1))
+        backward = forward[::-1]
+        jumps = random.Random(1).sample(forward, 200)
+        block = reader.keyframes[2]
+        within = [block + 5, block + 1, block + 30, block, block + 29, block + 2]
+        for tick in forward + backward + jumps + within:
+            assert reader.snapshot(tick) == recorded[tick]
+        assert reader.snapshot(first - 1) == recorded[first]
+        assert reader.snapshot(last + 1000) == recorded[last]
+    finally:
+        reader.close()
+
+
+def test_positions_past_16383_px(tmp_path):
+    world = create_world(20480, 11520, random.Random(0))
+    _, snapshots = play(world, 60, far_corner)
+    far = [(x, y) for s in snapshots for x, y, _, _, _ in s.bullets.values() if x / QUANT > 16383]
+    assert far
+    for previous, snapshot in zip(snapshots, snapshots[1:]):
+        assert decode(encode(snapshot), {}) == snapshot
+        assert decode(encode(snapshot, previous), {previous.tick: previous}) == snapshot
+
+    path = str(tmp_path / "large.aprp")
+    recorded = record(path, world, 60, far_corner)
+    reader = ReplayReader(path)
+    try:
+        for tick in sorted(recorded, reverse=True):
+            snapshot = reader.snapshot(tick)
+            assert snapshot == recorded[tick]
+            assert (snapshot.x[0] / QUANT, snapshot.y[0] / QUANT) == FAR
+    finally:
+        reader.close()
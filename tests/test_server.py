@@ -0,0 +1,30 @@
+import random
+
+from apoca.config import DEFAULT_SETTINGS
+from apoca.server import SNAPSHOT_HISTORY, GameClient
+from apoca.simulation import new_match, step
+from apoca.snapshot import encode, take_snapshot
+from apoca.world import create_world
+
+
+class OfflineClient(GameClient):
+    def _send(self):
+        pass  # No socket: the test plays the server's part
+
+
+def test_client_keeps_bounded_history_over_lossy_link():
+    world = create_world(1920, 1080, random.Random(0))
+    state = new_match(world, dict(DEFAULT_SETTINGS), 0, 1, -1, 2, 2, seed=0)
+    client = OfflineClient("bot")
+    rng = random.Random(0)
+    sent, previous = {}, None
+    for _ in range(1500):
+        step(state, [])
+        previous = sent[state.tick] = take_snapshot(state, previous)
+        if rng.random() < 0.05:
+            continue  # Lost datagram
+        baseline = sent.get(client.latest.tick) if client.latest else None
+        client.receive(encode(previous, baseline))
+        assert client.latest == previous
+        assert len(client.snapshots) <= SNAPSHOT_HISTORY
+        assert min(client.snapshots) > state.tick - SNAPSHOT_HISTORY
@@ -0,0 +1,28 @@
+import random
+import time
+
+from apoca import simulation
+from apoca.config import DEFAULT_SETTINGS
+from apoca.simulation import new_match, step
+from apoca.world import create_world
+
+
+def test_phase_times_add_up_to_step(monkeypatch):
+    # Slow AI makes any time booked to two phases stand out
+    decide = simulation.ai_decision
+
+    def slow_decision(*args):
+        time.sleep(0.001)
+        return decide(*args)
+
+    monkeypatch.setattr(simulation, "ai_decision", slow_decision)
+    world = create_world(1920, 1080, random.Random(0))
+    state = new_match(world, dict(DEFAULT_SETTINGS), 0, 1, -1, 2, 2, seed=0)
+    state.phase_times = {}
+    start = time.perf_counter()
+    for _ in range(50):
+        step(state, [])
+    elapsed = time.perf_counter() - start
+    booked = sum(state.phase_times.values())
+    assert state.phase_times["ai"] >= 50 * 4 * 0.001
+    assert 0.9 * elapsed <= booked <= elapsed